@@ -0,0 +1,321 @@
+"""
+Read-only HTTP API over the marts (stdlib http.server + backend.db).
+
+    python -m app.api --port 8095
+
+    GET /health                          data generation
+    GET /marts                           mart tables and their columns
+    GET /marts/<table>?kommun=Solna&lasar_start=2023&columns=kommun,totalt_per_elev&limit=100
+    GET /views/trend?lan=...&kommun=...&huvudman=...&subject=...
+    GET /views/fairness?year=...&lan=...&huvudman=...&subject=...&top_n=10
+    GET /views/parent_choice?lan=...
+
+Query parameters other than columns/limit/offset/format filter a mart by
+equality ("All" = no filter, as in the dashboard); the views return the same
+aggregations the dashboard pages plot (backend/queries.py).
+
+- Formats: JSON (default) or Arrow IPC stream with ?format=arrow or
+  Accept: application/vnd.apache.arrow.stream.
+- Results are streamed in record batches (chunked transfer), gzip-compressed
+  when the client accepts it.
+- Every response carries an ETag derived from the data generation and the
+  request; If-None-Match is answered with 304 before DuckDB is touched, so
+  polling clients cost a stat() of the database file.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import duckdb
+import pyarrow as pa
+
+from backend import queries
+from backend.db import data_generation, get_connection, query_df
+from backend.utils import is_all
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+BATCH_ROWS = 10_000
+RESERVED_PARAMS = {"columns", "limit", "offset", "format"}
+
+_CATALOG: dict[str, dict[str, list[str]]] = {}
+_CATALOG_LOCK = threading.Lock()
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def catalog() -> dict[str, list[str]]:
+    """{"schema.mart_x": [columns...]} for the current data generation (one query per generation)."""
+    gen = data_generation()
+    with _CATALOG_LOCK:
+        cached = _CATALOG.get(gen)
+        if cached is None:
+            df = query_df("""
+                SELECT table_schema, table_name, column_name
+                FROM information_schema.columns
+                WHERE table_name LIKE 'mart\\_%' ESCAPE '\\'
+                ORDER BY table_schema, table_name, ordinal_position
+            """)
+            cached = {}
+            for (schema, table), cols in df.groupby(["table_schema", "table_name"], sort=True):
+                cached[f"{schema}.{table}"] = cols["column_name"].tolist()
+            _CATALOG.clear()
+            _CATALOG[gen] = cached
+        return cached
+
+
+def _resolve_table(name: str) -> tuple[str, list[str]]:
+    tables = catalog()
+    if name in tables:
+        return name, tables[name]
+    # unqualified name -> first schema that has it (same order as backend.db)
+    matches = [t for t in tables if t.split(".", 1)[1] == name]
+    if not matches:
+        raise ApiError(404, f"unknown mart: {name}")
+    return matches[0], tables[matches[0]]
+
+
+def _quote(col: str) -> str:
+    return '"' + col.replace('"', '""') + '"'
+
+
+def mart_reader(table: str, params: dict[str, str]):
+    """(RecordBatchReader, cleanup) for a filtered, projected slice of one mart."""
+    qualified, columns = _resolve_table(table)
+
+    selected = [c.strip() for c in params.get("columns", "").split(",") if c.strip()] or columns
+    unknown = [c for c in selected if c not in columns]
+    filters = {k: v for k, v in params.items() if k not in RESERVED_PARAMS}
+    unknown += [c for c in filters if c not in columns]
+    if unknown:
+        raise ApiError(400, f"unknown column(s) for {qualified}: {', '.join(unknown)}")
+
+    where, values = queries.build_where({_quote(k): v for k, v in filters.items()})
+    sql = f"SELECT {', '.join(_quote(c) for c in selected)} FROM {qualified} WHERE {where}"
+    try:
+        if "limit" in params:
+            sql += f" LIMIT {int(params['limit'])}"
+        if "offset" in params:
+            sql += f" OFFSET {int(params['offset'])}"
+    except ValueError:
+        raise ApiError(400, "limit/offset must be integers") from None
+
+    con = get_connection(read_only=True, sql=sql)
+    try:
+        reader = con.execute(sql, values).fetch_record_batch(BATCH_ROWS)
+    except Exception:
+        con.close()
+        raise
+    return reader, con.close
+
+
+def _opt(params: dict[str, str], key: str):
+    value = params.get(key)
+    return "All" if is_all(value) else value
+
+
+def view_table(name: str, params: dict[str, str]) -> pa.Table:
+    """One of the dashboard aggregations as an Arrow table."""
+    if name == "trend":
+        color = "subject" if is_all(params.get("subject")) else "huvudman_typ"
+        df = queries.trend_series(
+            lan=_opt(params, "lan"),
+            kommun=_opt(params, "kommun"),
+            huvudman=_opt(params, "huvudman"),
+            subject=_opt(params, "subject"),
+            color=color,
+        )
+    elif name == "fairness":
+        year = _opt(params, "year")
+        if not is_all(year):
+            year = int(year)
+        df = queries.fairness_top_gap(
+            year=year,
+            lan=_opt(params, "lan"),
+            huvudman=_opt(params, "huvudman"),
+            subject=_opt(params, "subject"),
+            top_n=int(params.get("top_n", 10)),
+        )
+    elif name == "parent_choice":
+        df = queries.parent_choice_counts(_opt(params, "lan"))
+    else:
+        raise ApiError(404, f"unknown view: {name}")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _json_row(row: dict) -> dict:
+    """NaN/inf floats -> None (null): json.dumps would write NaN, which is not JSON."""
+    return {k: None if isinstance(v, float) and not math.isfinite(v) else v for k, v in row.items()}
+
+
+# ---------------- HTTP ----------------
+
+class _ChunkedWriter(io.RawIOBase):
+    """Chunked transfer encoding on top of the handler's socket, gzip optional."""
+
+    def __init__(self, wfile, gzip: bool):
+        super().__init__()
+        self.wfile = wfile
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def writable(self) -> bool:
+        return True
+
+    def _chunk(self, data: bytes) -> None:
+        if data:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def write(self, data: bytes) -> int:
+        self._chunk(self._gzip.compress(data) if self._gzip else bytes(data))
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self._gzip:
+            self._chunk(self._gzip.flush())
+        self.wfile.write(b"0\r\n\r\n")
+        super().close()
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # chunked responses + keep-alive
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query, keep_blank_values=False))
+        parts = [p for p in url.path.split("/") if p]
+        fmt = "arrow" if params.get("format") == "arrow" or ARROW_MIME in self.headers.get("Accept", "") else "json"
+
+        self._headers_sent = False
+        try:
+            # ETag first: a poll with an unchanged generation never reaches DuckDB
+            gen = data_generation()
+            tag = hashlib.sha1(f"{gen}|{url.path}|{sorted(params.items())}|{fmt}".encode("utf-8")).hexdigest()[:20]
+            etag = f'"{tag}"'
+            if etag in self.headers.get("If-None-Match", ""):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            if parts == ["health"]:
+                self._send_json({"status": "ok", "generation": gen}, etag)
+            elif parts == ["marts"]:
+                self._send_json({"generation": gen, "marts": catalog()}, etag)
+            elif len(parts) == 2 and parts[0] == "marts":
+                reader, cleanup = mart_reader(parts[1], params)
+                try:
+                    self._send_batches(reader, fmt, etag)
+                finally:
+                    cleanup()
+            elif len(parts) == 2 and parts[0] == "views":
+                self._send_batches(view_table(parts[1], params).to_reader(BATCH_ROWS), fmt, etag)
+            else:
+                raise ApiError(404, f"no such endpoint: {url.path}")
+        except (ApiError, ValueError, TypeError, duckdb.Error, OSError) as e:
+            if self._headers_sent:
+                # failed mid-stream: a second response would corrupt the first,
+                # so end the connection and let the client see a truncated body
+                self.close_connection = True
+                return
+            if isinstance(e, ApiError):
+                status = e.status
+            elif isinstance(e, OSError):
+                # database file missing / query server unreachable
+                status = 503
+            elif isinstance(e, duckdb.Error):
+                status = 500
+            else:
+                status = 400
+            self._send_json({"error": str(e)}, None, status)
+
+    def _accepts_gzip(self) -> bool:
+        return "gzip" in self.headers.get("Accept-Encoding", "")
+
+    def _send_json(self, payload, etag: str | None, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        gzip = self._accepts_gzip() and len(body) > 1024
+        if gzip:
+            body = zlib.compress(body, 6, wbits=31)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if gzip:
+            self.send_header("Content-Encoding", "gzip")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_batches(self, reader: pa.RecordBatchReader, fmt: str, etag: str) -> None:
+        gzip = self._accepts_gzip()
+        self.send_response(200)
+        self.send_header("Content-Type", ARROW_MIME if fmt == "arrow" else "application/json; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        if gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self._headers_sent = True
+
+        out = _ChunkedWriter(self.wfile, gzip)
+        if fmt == "arrow":
+            with pa.ipc.new_stream(out, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+        else:
+            # {"columns": [...], "rows": [{...}, ...]} written batch by batch
+            out.write(json.dumps({"columns": reader.schema.names}, ensure_ascii=False)[:-1].encode("utf-8"))
+            out.write(b', "rows": [')
+            sep = ""
+            for batch in reader:
+                rows = ",".join(
+                    json.dumps(_json_row(row), ensure_ascii=False, default=str, allow_nan=False)
+                    for row in batch.to_pylist()
+                )
+                if rows:
+                    out.write((sep + rows).encode("utf-8"))
+                    sep = ","
+            out.write(b"]}")
+        out.close()
+
+    def log_message(self, format, *args) -> None:  # noqa: A002 - BaseHTTPRequestHandler signature
+        pass
+
+
+def serve(host: str = "127.0.0.1", port: int = 8095) -> None:
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    print(f"✅ read-only API on http://{host}:{port}/marts")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Read-only JSON/Arrow HTTP API over the marts.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8095)
+    args = parser.parse_args()
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import re
+import sys
 from pathlib import Path
 
 import duckdb
@@ -10,6 +14,17 @@ import plotly.express as px
 import streamlit as st
 from streamlit_plotly_events import plotly_events
 
+try:
+    from geo import lod  # streamlit run app/app_karta.py
+    from geo.locator import KommunLocator
+    from geo.tiles import basemap_layout
+    from geo.topology import topojson_to_geojson
+except ImportError:
+    from app.geo import lod
+    from app.geo.locator import KommunLocator
+    from app.geo.tiles import basemap_layout
+    from app.geo.topology import topojson_to_geojson
+
 # ------------------------------------------------------------
 # App setup
 # ------------------------------------------------------------
@@ -18,7 +33,11 @@ st.set_page_config(page_title="Skolverket – karta", layout="wide")
 APP_DIR = Path(__file__).resolve().parent
 ROOT_DIR = APP_DIR.parent
 DB_PATH = ROOT_DIR / "csv_ingestion_pipeline.duckdb"
-GEO_KOMMUN_PARQUET = APP_DIR / "geo" / "processed" / "kommuner.parquet"
+GEO_PROCESSED_DIR = APP_DIR / "geo" / "processed"
+GEO_KOMMUN_PARQUET = GEO_PROCESSED_DIR / "kommuner.parquet"
+GEO_MANIFEST = GEO_PROCESSED_DIR / "manifest.json"
+# served by Streamlit at /app/static/geo/ (.streamlit/config.toml: enableStaticServing)
+GEO_STATIC_DIR = APP_DIR / "static" / "geo"
 
 DEFAULT_CENTER = {"lat": 62.0, "lon": 15.0}
 DEFAULT_ZOOM = 3.6
@@ -26,27 +45,111 @@ DEFAULT_ZOOM = 3.6
 # ------------------------------------------------------------
 # DB helpers
 # ------------------------------------------------------------
+# Query-server-läge (backend/query_server.py): servern äger databasfilen och
+# appen läser via dess socket i stället för att öppna filen själv
+QUERY_SERVER_SOCKET = os.getenv("QUERY_SERVER_SOCKET", "").strip()
+
+def _query_server():
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.insert(0, str(ROOT_DIR))
+    from backend import query_server
+    return query_server
+
 def get_con(read_only: bool = True) -> duckdb.DuckDBPyConnection:
+    if QUERY_SERVER_SOCKET and read_only:
+        return _query_server().connect(QUERY_SERVER_SOCKET)
     return duckdb.connect(str(DB_PATH), read_only=read_only)
 
 def sql_quote(value: str) -> str:
     return "'" + value.replace("'", "''") + "'"
 
-@st.cache_data(show_spinner=False)
-def load_df(sql: str) -> pd.DataFrame:
+# Kolumner som kartorna använder, per mart (resten läses aldrig in)
+MART_COLUMNS = {
+    "mart_ranked_kommun_ak9": [
+        "lasar_start", "kommun_kod", "kommun", "lan_kod", "score_0_100", "avg_total", "avg_gap_f_minus_m",
+    ],
+    "mart_ranked_lan_ak9": ["lasar_start", "lan_kod", "lan", "score_0_100", "avg_total", "avg_gap_f_minus_m"],
+    "mart_budget_per_elev_kommun": [
+        "lasar_start", "kommun_kod", "kommun", "lan_kod", "genomsnittligt_elevantal", "totalt_per_elev",
+    ],
+    "mart_budget_per_elev_lan": ["lasar_start", "lan_kod", "lan", "genomsnittligt_elevantal", "totalt_per_elev"],
+}
+
+def db_generation() -> str:
+    """Ändras när pipelinen skriver om databasen (mtime + storlek) -> nycklar cachen."""
+    if QUERY_SERVER_SOCKET:
+        # serverns snapshot, inte filen (den kan redan skrivas om)
+        try:
+            return _query_server().client(QUERY_SERVER_SOCKET).generation()
+        except OSError:
+            pass
+    try:
+        stat = DB_PATH.stat()
+    except FileNotFoundError:
+        return "missing"
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def load_mart(schema: str, table: str, generation: str) -> dict[int, pd.DataFrame]:
+    """
+    Hela marten en gång per (schema, datagenerering), med kompakta kolumner,
+    uppdelad per lasar_start -> byte av år/mått är bara ett uppslag i minnet.
+    Delas mellan sessioner: year_frame() ger en kopia att ändra i.
+    """
+    cols = ", ".join(f'"{c}"' for c in MART_COLUMNS[table])
+    # inga except här: ett fel ska inte cachas, det visas av read_or_stop()
     with get_con(read_only=True) as con:
-        return con.execute(sql).df()
-
-@st.cache_data(show_spinner=False)
-def distinct_vals(table: str, col: str) -> list:
-    df = load_df(f'SELECT DISTINCT "{col}" AS v FROM {table} WHERE "{col}" IS NOT NULL ORDER BY 1')
-    return df["v"].tolist()
+        df = con.execute(f"SELECT {cols} FROM {schema}.{table} WHERE lasar_start IS NOT NULL").df()
+
+    df["lasar_start"] = df["lasar_start"].astype("int16")
+    if "kommun_kod" in df:
+        df["kommun_kod"] = df["kommun_kod"].astype(str).str.zfill(4)
+    df["lan_kod"] = df["lan_kod"].astype(str).str.zfill(2)
+    for c in ("kommun", "lan"):
+        if c in df:
+            df[c] = df[c].astype("category")
+    for c in df.columns:
+        if pd.api.types.is_float_dtype(df[c]) or c in ("totalt_per_elev", "genomsnittligt_elevantal"):
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float32")
+
+    return {int(y): part.reset_index(drop=True) for y, part in df.groupby("lasar_start", sort=True)}
+
+def year_frame(schema: str, table: str, year: int, cols: list[str]) -> pd.DataFrame:
+    """Kolumnerna `cols` för ett år ur den förladdade marten (kopia, tom om saknas)."""
+    part = load_mart(schema, table, db_generation()).get(int(year))
+    if part is None:
+        return pd.DataFrame(columns=cols)
+    return part[cols].copy()
+
+def mart_years(schema: str, table: str) -> list[int]:
+    return list(load_mart(schema, table, db_generation()))
+
+def read_or_stop(fn, schema: str, table: str, *args):
+    """
+    mart_years()/year_frame() för en sida: ett DuckDB- eller query-server-fel
+    visas i appen och sidan stoppas (nästa körning försöker igen).
+    """
+    try:
+        return fn(schema, table, *args)
+    except (duckdb.Error, OSError) as e:
+        st.error(f"Kunde inte läsa {schema}.{table}: {e}")
+        st.stop()
 
 # ------------------------------------------------------------
 # Geo helpers (cache + simplify)
 # ------------------------------------------------------------
+# De cachade geo-funktionerna tar `generation` (geo_generation()) som argument:
+# en ny körning av preprocess_geo.py ger nya nycklar, utan omstart.
+def geo_generation() -> str:
+    """Ändras när preprocess_geo.py skriver nya artefakter (manifestets mtime + storlek)."""
+    try:
+        stat = GEO_MANIFEST.stat()
+    except FileNotFoundError:
+        return "missing"
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
 @st.cache_data(show_spinner=False)
-def load_kommun_geo_base() -> gpd.GeoDataFrame:
+def load_kommun_geo_base(generation: str) -> gpd.GeoDataFrame:
     if not GEO_KOMMUN_PARQUET.exists():
         raise FileNotFoundError(f"Geo parquet saknas: {GEO_KOMMUN_PARQUET}")
 
@@ -69,49 +172,189 @@ def load_kommun_geo_base() -> gpd.GeoDataFrame:
     return gdf
 
 @st.cache_data(show_spinner=False)
-def load_kommun_geo_simplified(tolerance: float) -> gpd.GeoDataFrame:
-    gdf = load_kommun_geo_base().copy()
+def load_kommun_geo_simplified(tolerance: float, generation: str) -> gpd.GeoDataFrame:
+    gdf = load_kommun_geo_base(generation).copy()
     # Den här raden gör geometrin lättare/snabbare:
     if tolerance and float(tolerance) > 0:
         gdf["geometry"] = gdf["geometry"].simplify(tolerance=float(tolerance), preserve_topology=True)
     return gdf
 
 @st.cache_data(show_spinner=False)
-def geojson_from_geo(tolerance: float) -> dict:
+def _geo_manifest(generation: str) -> dict:
+    if not GEO_MANIFEST.exists():
+        return {}
+    return json.loads(GEO_MANIFEST.read_text(encoding="utf-8"))
+
+def geo_manifest() -> dict:
+    """Manifest från app/geo/preprocess_geo.py (nivåer + zoom-pyramid), tom om inga artefakter."""
+    return _geo_manifest(geo_generation())
+
+def level_for_zoom(zoom: float, layer: str = "kommuner") -> float:
+    """Förenklingsnivå för en zoom: grov för hela Sverige, detaljerad inzoomat."""
+    manifest = geo_manifest()
+    pyramid = manifest.get("lod", {}).get(layer)
+    if pyramid:
+        z = min(max(int(zoom), lod.MIN_ZOOM), lod.MAX_ZOOM)
+        return float(pyramid[str(z)])
+    levels = [float(t) for t in manifest.get("geojson", {}).get(layer, {})]
+    return lod.tolerance_for_zoom(zoom, levels) if levels else 0.01
+
+@st.cache_resource(show_spinner=False)
+def geojson_from_geo(tolerance: float, layer: str, generation: str) -> dict | None:
     """
-    Cachebar version: vi bygger geojson från geo (inte från merged gdf).
-    Då slipper vi att Streamlit försöker hash:a GeoDataFrame som argument.
+    Förberäknad geometri (app/geo/preprocess_geo.py), parsad en gång per process
+    och delad mellan sessioner -> ingen geometri-beräkning per request.
+    GeoJSON:en är avkodad från TopoJSON (delade gränser) -> inga glapp mellan
+    kommuner. Saknas den avkodar vi TopoJSON direkt.
+    Finns inga artefakter bygger vi kommunerna från geo (inte från merged gdf).
     """
-    gdf = load_kommun_geo_simplified(tolerance)
+    path = GEO_PROCESSED_DIR / f"{layer}_{float(tolerance):g}.geojson"
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    topo = GEO_PROCESSED_DIR / f"{layer}_{float(tolerance):g}.topojson"
+    if topo.exists():
+        return topojson_to_geojson(json.loads(topo.read_text(encoding="utf-8")), layer)
+    if layer != "kommuner":
+        return None
+    gdf = load_kommun_geo_simplified(tolerance, generation)
     return json.loads(gdf.to_json())
 
+@st.cache_resource(show_spinner=False)
+def lan_bboxes(generation: str) -> dict[str, tuple]:
+    """Län -> bbox, från den grövsta län-nivån (räcker för att välja vy)."""
+    geojson = geojson_from_geo(level_for_zoom(lod.MIN_ZOOM, "lan"), "lan", generation)
+    if not geojson:
+        return {}
+    out = {}
+    for f in geojson["features"]:
+        bbox = f.get("bbox") or lod.geometry_bbox(f.get("geometry"))
+        if bbox:
+            out[str(f["properties"].get("lan", "")).strip()] = tuple(bbox)
+    return dict(sorted(out.items()))
+
+@st.cache_resource(show_spinner=False)
+def lan_namn_by_kod(generation: str) -> dict[str, str]:
+    """lan_kod -> länsnamn som i geo-lagret (används för drill-down från län-kartan)."""
+    geojson = geojson_from_geo(level_for_zoom(lod.MIN_ZOOM, "lan"), "lan", generation)
+    if not geojson:
+        return {}
+    return {
+        str(f["properties"].get("lan_kod", "")).zfill(2): str(f["properties"].get("lan", "")).strip()
+        for f in geojson["features"]
+    }
+
+@st.cache_resource(show_spinner=False)
+def map_view(area: str, generation: str) -> tuple[dict, dict, float]:
+    """
+    (geojson, center, zoom) för ett område. Hela Sverige: grov nivå för hela
+    landet. Ett län: zoom som passar länet, finare nivå, bara synliga kommuner.
+    """
+    bbox = lan_bboxes(generation).get(area)
+    if bbox is None:
+        geojson = geojson_from_geo(level_for_zoom(DEFAULT_ZOOM), "kommuner", generation)
+        return geojson, DEFAULT_CENTER, DEFAULT_ZOOM
+
+    view = lod.pad_bbox(bbox)
+    zoom = lod.zoom_for_bbox(view)
+    geojson = kommun_locator(level_for_zoom(zoom), generation).crop(
+        geojson_from_geo(level_for_zoom(zoom), "kommuner", generation), view
+    )
+    return geojson, lod.bbox_center(view), zoom
+
+@st.cache_resource(show_spinner=False)
+def kommun_locator(tolerance: float, generation: str) -> KommunLocator:
+    """STRtree över kommunpolygonerna på en nivå: vilka kommuner syns i vyn (polygon, inte bbox)."""
+    return KommunLocator.from_geojson(geojson_from_geo(tolerance, "kommuner", generation))
+
+@st.cache_resource(show_spinner=False)
+def geojson_static_url(name: str, generation: str, _geojson: dict) -> str:
+    """
+    Skriver geojson en gång till app/static/geo/ (hash i filnamnet) och returnerar
+    dess URL. Figuren innehåller då bara URL:en: webbläsaren hämtar och cachar
+    geometrin en gång, och byte av år/mått skickar bara kommun_kod -> värde.
+    `name` måste vara unikt per innehåll (lager, nivå, område); `generation`
+    (geo_generation()) gör att nya geo-artefakter skrivs ut på nytt.
+    Äldre filer med samma `name` tas bort.
+    """
+    payload = json.dumps(_geojson, separators=(",", ":")).encode("utf-8")
+    file_name = f"{name}-{hashlib.sha1(payload).hexdigest()[:12]}.geojson"
+    path = GEO_STATIC_DIR / file_name
+    if not path.exists():
+        GEO_STATIC_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(payload)
+        tmp.replace(path)
+    for old in GEO_STATIC_DIR.glob(f"{name}-*.geojson"):
+        # bara exakt `name` + hash (inte t.ex. kommuner_0.01_X för kommuner_0.01)
+        if old != path and re.fullmatch(rf"{re.escape(name)}-[0-9a-f]{{12}}\.geojson", old.name):
+            old.unlink(missing_ok=True)
+    base = (st.get_option("server.baseUrlPath") or "").strip("/")
+    prefix = f"/{base}" if base else ""
+    return f"{prefix}/app/static/geo/{file_name}"
+
+def geojson_ref(geojson: dict, name: str) -> dict | str:
+    """URL till geometrin när statisk servering är på, annars dicten som förut."""
+    if not st.get_option("server.enableStaticServing"):
+        return geojson
+    return geojson_static_url(re.sub(r"[^0-9A-Za-z_.-]+", "_", name), geo_generation(), geojson)
+
+def clicked_kommun_kod(event: dict, df: pd.DataFrame, code_col: str = "kommun_kod") -> str | None:
+    """
+    Kod (kommun_kod, eller lan_kod på län-kartan) för ett klick från plotly_events.
+    Händelsen har bara x/y/curveNumber/pointNumber/pointIndex: punktindex är
+    raden i df (samma ordning som i kartan).
+    """
+    width = 4 if code_col == "kommun_kod" else 2
+    i = event.get("pointIndex", event.get("pointNumber"))
+    if i is not None and 0 <= int(i) < len(df):
+        return str(df[code_col].iloc[int(i)]).zfill(width)
+    return None
+
+def drill_down(lan: str) -> None:
+    """Knapp-callback: från län-kartan till kommunerna i ett län."""
+    st.session_state["niva"] = "Kommun"
+    st.session_state["omrade"] = lan
+
+def lan_drill_down(selected: list, df: pd.DataFrame, value_col: str) -> None:
+    """Visa valt län + knapp för att zooma in på dess kommuner."""
+    lk = clicked_kommun_kod(selected[0], df, "lan_kod") if selected else None
+    if not lk:
+        return
+    row = df[df["lan_kod"] == lk]
+    if row.empty:
+        return
+    v = row.iloc[0][value_col]
+    st.info(f"Valt län: {row.iloc[0]['lan']} ({lk}) — {value_col}: {v:,.1f}".replace(",", " "))
+    lan = lan_namn_by_kod(geo_generation()).get(lk)
+    if lan in lan_bboxes(geo_generation()):
+        st.button(f"Visa kommunerna i {lan}", on_click=drill_down, args=(lan,))
+
 # ------------------------------------------------------------
 # Plot helpers
 # ------------------------------------------------------------
 def make_sweden_choropleth(
-    gdf_geo: gpd.GeoDataFrame,
-    geojson: dict,
+    geojson: dict | str,
     df_values: pd.DataFrame,
     value_col: str,
     title: str,
     center: dict,
     zoom: float,
     key: str,
+    location_col: str = "kommun_kod",
+    name_col: str = "kommun",
 ) -> tuple:
     df = df_values.copy()
-    df["kommun_kod"] = df["kommun_kod"].astype(str).str.zfill(4)
+    df[location_col] = df[location_col].astype(str).str.zfill(4 if location_col == "kommun_kod" else 2)
 
-    # Plotly behöver bara df + geojson. Geo-dataframe används bara som "template" för locations,
-    # men vi kan skicka df direkt.
+    # Plotly behöver bara df + geojson.
     fig = px.choropleth_mapbox(
         df,
         geojson=geojson,
-        locations="kommun_kod",
-        featureidkey="properties.kommun_kod",
+        locations=location_col,
+        featureidkey=f"properties.{location_col}",
         color=value_col,
-        hover_name="kommun",
-        hover_data={"kommun_kod": True, value_col: True},
-        mapbox_style="carto-positron",
+        hover_name=name_col,
+        hover_data={location_col: True, value_col: True},
         center={"lat": center["lat"], "lon": center["lon"]},
         zoom=float(zoom),
         opacity=0.75,
@@ -120,7 +363,8 @@ def make_sweden_choropleth(
 
     # Viktigt: fullscreen/fitbounds kan strula i vissa plotly-versioner,
     # så vi kör med fast center+zoom för Sverige.
-    fig.update_layout(margin={"r": 0, "t": 55, "l": 0, "b": 0})
+    # baskarta: lokala tiles om BASEMAP_TILE_URL är satt (app/geo/tiles.py), annars carto-positron
+    fig.update_layout(margin={"r": 0, "t": 55, "l": 0, "b": 0}, **basemap_layout())
 
     selected = plotly_events(
         fig,
@@ -132,7 +376,8 @@ def make_sweden_choropleth(
     )
     return fig, selected
 
-def bar_top_bottom(df: pd.DataFrame, value_col: str, n: int):
+def bar_top_bottom(df: pd.DataFrame, value_col: str, n: int, label_col: str = "kommun"):
+    label = "Län" if label_col == "lan" else "Kommun"
     d = df.dropna(subset=[value_col]).copy()
     d[value_col] = pd.to_numeric(d[value_col], errors="coerce")
     d = d.dropna(subset=[value_col])
@@ -143,20 +388,20 @@ def bar_top_bottom(df: pd.DataFrame, value_col: str, n: int):
     fig_top = px.bar(
         top.sort_values(value_col, ascending=True),
         x=value_col,
-        y="kommun",
+        y=label_col,
         orientation="h",
         title=f"Top {n} (högst {value_col})",
-        labels={"kommun": "Kommun", value_col: value_col},
+        labels={label_col: label, value_col: value_col},
     )
     fig_top.update_layout(margin={"l": 0, "r": 0, "t": 60, "b": 0}, height=520)
 
     fig_bot = px.bar(
         bot.sort_values(value_col, ascending=False),
         x=value_col,
-        y="kommun",
+        y=label_col,
         orientation="h",
         title=f"Bottom {n} (lägst {value_col})",
-        labels={"kommun": "Kommun", value_col: value_col},
+        labels={label_col: label, value_col: value_col},
     )
     fig_bot.update_layout(margin={"l": 0, "r": 0, "t": 60, "b": 0}, height=520)
 
@@ -182,13 +427,26 @@ with st.sidebar:
     page = st.radio("Välj vy", ["Karta (Ranking)", "Karta (Budget per elev)"], index=1)
 
     st.markdown("---")
-    st.caption("Kartutjämning (snabbare/lättare)")
-    tolerance = st.slider("Förenkling", 0.0, 0.05, 0.01, 0.005)
+    st.caption("Kartvy (detaljnivån följer zoomen)")
+    niva = st.radio("Nivå", ["Kommun", "Län"], horizontal=True, key="niva")
+    by_lan = niva == "Län"
+    area = st.selectbox(
+        "Område", ["Hela Sverige"] + list(lan_bboxes(geo_generation())), index=0, key="omrade", disabled=by_lan
+    )
 
-# Ladda geo (cachad) + geojson (cachad, baserat på tolerance)
+# Ladda geojson (cachad per område; förberäknade nivåer, inget förenklas om).
+# Län-nivån: 21 färdiga länsgränser i stället för 290 kommuner.
 try:
-    gdf_geo = load_kommun_geo_simplified(tolerance)
-    geojson = geojson_from_geo(tolerance)
+    if by_lan:
+        tol = level_for_zoom(DEFAULT_ZOOM, "lan")
+        geojson = geojson_from_geo(tol, "lan", geo_generation())
+        if geojson is None:
+            raise FileNotFoundError("län-geometri saknas, kör python -m app.geo.preprocess_geo")
+        map_center, map_zoom = DEFAULT_CENTER, DEFAULT_ZOOM
+        geojson = geojson_ref(geojson, f"lan_{tol:g}")
+    else:
+        geojson, map_center, map_zoom = map_view(area, geo_generation())
+        geojson = geojson_ref(geojson, f"kommuner_{level_for_zoom(map_zoom):g}_{area}")
 except Exception as e:
     st.error(f"Kunde inte läsa geo-data: {e}")
     st.stop()
@@ -197,10 +455,9 @@ except Exception as e:
 # PAGE 1: Ranking
 # ------------------------------------------------------------
 if page == "Karta (Ranking)":
-    st.subheader("Sverigekarta – kommunranking (åk 9)")
+    st.subheader("Sverigekarta – länsranking (åk 9)" if by_lan else "Sverigekarta – kommunranking (åk 9)")
 
-    table = f"{dbt_schema}.mart_ranked_kommun_ak9"
-    years = distinct_vals(table, "lasar_start")
+    years = read_or_stop(mart_years, dbt_schema, "mart_ranked_kommun_ak9")
     if not years:
         st.warning("Inga år hittades i mart_ranked_kommun_ak9.")
         st.stop()
@@ -211,27 +468,33 @@ if page == "Karta (Ranking)":
     with c2:
         metric = st.selectbox("Färgskala", ["score_0_100", "avg_total", "avg_gap_f_minus_m"], index=0)
 
-    df_scores = load_df(f"""
-        SELECT kommun_kod, kommun, {metric} AS {metric}
-        FROM {table}
-        WHERE lasar_start = {int(year)}
-    """)
+    if by_lan:
+        # förberäknat per län (dbt: mart_ranked_lan_ak9)
+        df_scores = read_or_stop(year_frame, dbt_schema, "mart_ranked_lan_ak9", year, ["lan_kod", "lan", metric])
+    else:
+        df_scores = read_or_stop(
+            year_frame, dbt_schema, "mart_ranked_kommun_ak9", year, ["kommun_kod", "kommun", metric]
+        )
 
     fig, selected = make_sweden_choropleth(
-        gdf_geo=gdf_geo,
         geojson=geojson,
         df_values=df_scores,
         value_col=metric,
         title=f"Ranking – {metric} ({year})",
-        center=DEFAULT_CENTER,
-        zoom=DEFAULT_ZOOM,
-        key="map_ranking",
+        center=map_center,
+        zoom=map_zoom,
+        key="map_ranking_lan" if by_lan else "map_ranking",
+        location_col="lan_kod" if by_lan else "kommun_kod",
+        name_col="lan" if by_lan else "kommun",
     )
-    st.plotly_chart(fig, use_container_width=True)
 
-    if selected:
-        kk = str(selected[0].get("location", "")).zfill(4)
-        row = df_scores[df_scores["kommun_kod"].astype(str).str.zfill(4) == kk]
+    if by_lan:
+        lan_drill_down(selected, df_scores, metric)
+        st.stop()
+
+    kk = clicked_kommun_kod(selected[0], df_scores) if selected else None
+    if kk:
+        row = df_scores[df_scores["kommun_kod"] == kk]
         if not row.empty:
             st.info(f"Vald kommun: {row.iloc[0]['kommun']} ({kk})")
 
@@ -239,10 +502,9 @@ if page == "Karta (Ranking)":
 # PAGE 2: Budget per elev (Din huvudvy)
 # ------------------------------------------------------------
 else:
-    st.subheader("Budget per elev (kommuner)")
+    st.subheader("Budget per elev (län)" if by_lan else "Budget per elev (kommuner)")
 
-    budget_table = f"{dbt_schema}.mart_budget_per_elev_kommun"
-    years = distinct_vals(budget_table, "lasar_start")
+    years = read_or_stop(mart_years, dbt_schema, "mart_budget_per_elev_kommun")
     if not years:
         st.error("Hittar inga år i mart_budget_per_elev_kommun. Har du kört dbt för den modellen?")
         st.stop()
@@ -253,40 +515,54 @@ else:
         year = st.selectbox("Läsår start", years, index=len(years) - 1)
         n = st.slider("Antal kommuner i jämförelse", 10, 80, 40, 5)
 
-    df_budget = load_df(f"""
-        SELECT kommun_kod, kommun, totalt_per_elev
-        FROM {budget_table}
-        WHERE lasar_start = {int(year)}
-    """)
+    if by_lan:
+        # förberäknat per län och huvudman (dbt: mart_budget_per_elev_lan),
+        # viktat med elevantal över huvudmännen
+        d = read_or_stop(
+            year_frame, dbt_schema, "mart_budget_per_elev_lan", year,
+            ["lan_kod", "lan", "genomsnittligt_elevantal", "totalt_per_elev"],
+        )
+        d["w"] = d["totalt_per_elev"] * d["genomsnittligt_elevantal"]
+        g = d.groupby(["lan_kod", "lan"], observed=True)[["w", "genomsnittligt_elevantal"]].sum()
+        df_budget = (g["w"] / g["genomsnittligt_elevantal"]).rename("totalt_per_elev").reset_index()
+    else:
+        df_budget = read_or_stop(
+            year_frame, dbt_schema, "mart_budget_per_elev_kommun", year, ["kommun_kod", "kommun", "totalt_per_elev"]
+        )
 
     if df_budget.empty:
         st.warning("Inga rader för valt år.")
         st.stop()
+    code_col = "lan_kod" if by_lan else "kommun_kod"
 
     # 1) EN karta (Sverige) – ingen extra karta längre ner
     fig_map, selected = make_sweden_choropleth(
-        gdf_geo=gdf_geo,
         geojson=geojson,
         df_values=df_budget,
         value_col="totalt_per_elev",
-        title=f"Budget per elev – {year}",
-        center=DEFAULT_CENTER,
-        zoom=DEFAULT_ZOOM,
-        key="map_budget",
+        title=f"Budget per elev – {year}" + (" (elevviktat per län)" if by_lan else ""),
+        center=map_center,
+        zoom=map_zoom,
+        key="map_budget_lan" if by_lan else "map_budget",
+        location_col=code_col,
+        name_col="lan" if by_lan else "kommun",
     )
-    st.plotly_chart(fig_map, use_container_width=True)
 
-    if selected:
-        kk = str(selected[0].get("location", "")).zfill(4)
-        row = df_budget[df_budget["kommun_kod"].astype(str).str.zfill(4) == kk]
+    kk = None
+    if by_lan:
+        lan_drill_down(selected, df_budget, "totalt_per_elev")
+    else:
+        kk = clicked_kommun_kod(selected[0], df_budget) if selected else None
+    if kk:
+        row = df_budget[df_budget["kommun_kod"] == kk]
         if not row.empty:
             kommun = row.iloc[0]["kommun"]
             v = row.iloc[0]["totalt_per_elev"]
             st.success(f"Vald kommun: {kommun} ({kk}) — totalt_per_elev: {v:,.0f}".replace(",", " "))
 
     # 2) Jämförelse Top/Bottom
-    st.markdown("## Jämförelse mellan kommuner")
-    fig_top, fig_bot = bar_top_bottom(df_budget, "totalt_per_elev", int(n))
+    st.markdown("## Jämförelse mellan län" if by_lan else "## Jämförelse mellan kommuner")
+    fig_top, fig_bot = bar_top_bottom(df_budget, "totalt_per_elev", int(n), "lan" if by_lan else "kommun")
 
     c1, c2 = st.columns(2)
     with c1:
@@ -0,0 +1,53 @@
+"""
+Viewport filtering of the kommun layer with a shapely STRtree.
+
+A län drill-down draws only the kommuner that are visible in its padded
+view. Comparing bounding boxes (lod.crop_features) also keeps kommuner whose
+bbox reaches into the view while the polygon itself doesn't, e.g. long
+coastal or mountain kommuner next to the län. The tree tests the polygons:
+
+    loc = KommunLocator.from_geojson(geojson)    # 290 polygons, a few ms
+    loc.kommuner_in_bbox((17.5, 59.0, 18.5, 59.7))
+    loc.crop(geojson, view)                      # FeatureCollection for the map
+
+Used by both frontends: backend/geo_artifacts.geojson_for_view (Taipy) and
+map_view in app/app_karta.py (Streamlit).
+"""
+from __future__ import annotations
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+
+class KommunLocator:
+    def __init__(self, kommun_kod, geometries):
+        self.kommun_kod = np.asarray(kommun_kod, dtype=object)
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.tree = shapely.STRtree(self.geometries)
+
+    @classmethod
+    def from_geojson(cls, geojson: dict) -> "KommunLocator":
+        """From a kommun FeatureCollection (properties.kommun_kod), any simplification level."""
+        kod, geoms = [], []
+        for f in geojson["features"]:
+            code = f.get("properties", {}).get("kommun_kod")
+            if code is None or not f.get("geometry"):
+                continue
+            kod.append(str(code).zfill(4))
+            geoms.append(shape(f["geometry"]))
+        return cls(kod, geoms)
+
+    def kommuner_in_bbox(self, bbox) -> list[str]:
+        """Sorted kommun_kod of the polygons intersecting bbox (lon_min, lat_min, lon_max, lat_max)."""
+        hits = self.tree.query(shapely.box(*bbox), predicate="intersects")
+        return sorted(self.kommun_kod[hits])
+
+    def crop(self, geojson: dict, bbox) -> dict:
+        """FeatureCollection with the features of `geojson` whose kommun intersects `bbox`."""
+        keep = set(self.kommuner_in_bbox(bbox))
+        features = [
+            f for f in geojson["features"]
+            if str(f.get("properties", {}).get("kommun_kod", "")).zfill(4) in keep
+        ]
+        return {"type": "FeatureCollection", "features": features}
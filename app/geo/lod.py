@@ -0,0 +1,98 @@
+"""
+Zoom-dependent level of detail for the map layers (stdlib only).
+
+app/geo/preprocess_geo.py writes each layer at a few simplification levels and
+a zoom -> level table (the pyramid) into the manifest. At request time we only
+pick a level for the map zoom and, when zoomed in, keep the features whose
+bbox intersects the visible area:
+
+- zoomed out: coarse geometry for the whole country (small payload)
+- zoomed in: fine geometry, but only for the visible part of Sweden
+"""
+from __future__ import annotations
+
+import math
+
+TILE_SIZE = 512  # mapbox-gl (plotly mapbox) tile size in pixels
+MIN_ZOOM, MAX_ZOOM = 3, 8
+
+
+def pixel_degrees(zoom: float) -> float:
+    """Width of one screen pixel in degrees of longitude at `zoom`."""
+    return 360.0 / (TILE_SIZE * 2.0 ** zoom)
+
+
+def tolerance_for_zoom(zoom: float, levels: list[float]) -> float:
+    """
+    Coarsest available tolerance that stays below half a pixel at `zoom`
+    (finer simplification would not be visible). Falls back to the finest level.
+    """
+    levels = sorted(levels)
+    limit = pixel_degrees(zoom) / 2.0
+    fitting = [t for t in levels if t <= limit]
+    return fitting[-1] if fitting else levels[0]
+
+
+def zoom_pyramid(levels: list[float]) -> dict[str, float]:
+    """Zoom level -> tolerance for every integer zoom the maps use."""
+    return {str(z): tolerance_for_zoom(z, levels) for z in range(MIN_ZOOM, MAX_ZOOM + 1)}
+
+
+def zoom_for_bbox(bbox: tuple[float, float, float, float], width_px: int = 800, height_px: int = 560) -> float:
+    """Zoom that fits `bbox` (lon_min, lat_min, lon_max, lat_max) into the map viewport."""
+    xmin, ymin, xmax, ymax = bbox
+    lat_c = math.radians((ymin + ymax) / 2.0)
+    dx = max(xmax - xmin, 1e-6)
+    # web mercator stretches latitude by 1 / cos(lat)
+    dy = max((ymax - ymin) / math.cos(lat_c), 1e-6)
+    zoom = min(
+        math.log2(width_px * 360.0 / (TILE_SIZE * dx)),
+        math.log2(height_px * 360.0 / (TILE_SIZE * dy)),
+    )
+    return max(float(MIN_ZOOM), min(float(MAX_ZOOM), zoom))
+
+
+def geometry_bbox(geometry: dict | None) -> list[float] | None:
+    """[lon_min, lat_min, lon_max, lat_max] of a GeoJSON geometry."""
+    if not geometry:
+        return None
+    xs: list[float] = []
+    ys: list[float] = []
+
+    def walk(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            xs.append(coords[0])
+            ys.append(coords[1])
+        else:
+            for c in coords:
+                walk(c)
+
+    walk(geometry.get("coordinates", []))
+    if not xs:
+        return None
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def pad_bbox(bbox, fraction: float = 0.1) -> tuple[float, float, float, float]:
+    xmin, ymin, xmax, ymax = bbox
+    px = (xmax - xmin) * fraction
+    py = (ymax - ymin) * fraction
+    return (xmin - px, ymin - py, xmax + px, ymax + py)
+
+
+def bbox_center(bbox) -> dict:
+    xmin, ymin, xmax, ymax = bbox
+    return {"lat": (ymin + ymax) / 2.0, "lon": (xmin + xmax) / 2.0}
+
+
+def crop_features(geojson: dict, bbox) -> dict:
+    """FeatureCollection with only the features whose bbox intersects `bbox`."""
+    xmin, ymin, xmax, ymax = bbox
+    features = []
+    for f in geojson["features"]:
+        fb = f.get("bbox") or geometry_bbox(f.get("geometry"))
+        if fb is None:
+            continue
+        if fb[0] <= xmax and fb[2] >= xmin and fb[1] <= ymax and fb[3] >= ymin:
+            features.append(f)
+    return {"type": "FeatureCollection", "features": features}
@@ -1,8 +1,20 @@
 from __future__ import annotations
 
+import argparse
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import geopandas as gpd
+import shapely
+
+try:
+    from app.geo.lod import geometry_bbox, zoom_pyramid
+    from app.geo.topology import topojson_to_geojson
+except ImportError:  # run as a script: python app/geo/preprocess_geo.py
+    from lod import geometry_bbox, zoom_pyramid
+    from topology import topojson_to_geojson
 
 
 # -------------------------
@@ -14,6 +26,21 @@ RAW_DIR = GEO_DIR / "raw"
 OUT_DIR = GEO_DIR / "processed"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Map artifacts: cropped + simplified geometry per tolerance, loaded as-is by
+# the dashboards (no geometry work at request time). Each level is stored as
+# TopoJSON (shared arcs, quantized + delta-encoded) and as GeoJSON decoded
+# from it, so neighbouring polygons are simplified identically (no gaps).
+# The manifest also maps every map zoom to a level (see app/geo/lod.py);
+# GeoJSON features carry a bbox so zoomed-in views can be cropped cheaply.
+SWEDEN_BBOX = (10.5, 55.0, 24.5, 69.5)  # lon_min, lat_min, lon_max, lat_max
+GEOJSON_LEVELS = (0.003, 0.01, 0.02, 0.05)
+QUANTIZATION = 1e5  # grid steps per axis (~15 m across Sweden)
+
+# Bump when the processing itself changes: outputs are only rebuilt when the
+# raw file or these build settings change (see source_hash()).
+BUILD_VERSION = 1
+MANIFEST_FILE = OUT_DIR / "manifest.json"
+
 
 # -------------------------
 # Helpers
@@ -27,23 +54,88 @@ def ensure_wgs84(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
 
 def fix_geometries(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     """
-    Fix invalid geometries. buffer(0) is a common trick, but can be expensive.
-    We only apply it when needed.
+    Fix invalid geometries with one vectorized make_valid() over the invalid
+    ones only. make_valid can return collections (polygon + stray lines); we
+    keep the polygonal parts so every kommun stays a (Multi)Polygon.
     """
-    try:
-        invalid_mask = ~gdf.is_valid
-        if invalid_mask.any():
-            gdf.loc[invalid_mask, "geometry"] = gdf.loc[invalid_mask, "geometry"].buffer(0)
-    except Exception:
-        # If is_valid fails for any reason, fall back to a cautious attempt
-        gdf["geometry"] = gdf["geometry"].buffer(0)
+    geoms = gdf.geometry.to_numpy()
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        fixed = shapely.make_valid(geoms[invalid])
+        collections = shapely.get_type_id(fixed) == 7  # GeometryCollection
+        for i in collections.nonzero()[0]:
+            parts = shapely.get_parts(fixed[i])
+            polygons = parts[shapely.get_type_id(parts) >= 3]  # Polygon, MultiPolygon
+            fixed[i] = shapely.union_all(polygons)
+        geoms = geoms.copy()
+        geoms[invalid] = fixed
+        gdf = gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs))
     return gdf
 
 
 def simplify(gdf: gpd.GeoDataFrame, tolerance: float) -> gpd.GeoDataFrame:
-    gdf_s = gdf.copy()
-    gdf_s["geometry"] = gdf_s["geometry"].simplify(tolerance, preserve_topology=True)
-    return gdf_s
+    """Simplify the whole geometry array in one call; attributes are not copied twice."""
+    geoms = shapely.simplify(gdf.geometry.to_numpy(), tolerance, preserve_topology=True)
+    attrs = gdf.drop(columns=gdf.geometry.name)
+    return gpd.GeoDataFrame(attrs, geometry=gpd.GeoSeries(geoms, index=gdf.index), crs=gdf.crs)
+
+
+def crop_to_sweden(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Drop features outside the Sweden bounding box (so the map won't show Norway/Finland)."""
+    xmin, ymin, xmax, ymax = SWEDEN_BBOX
+    return gdf.cx[xmin:xmax, ymin:ymax]
+
+
+def level_path(base_name: str, tolerance: float, suffix: str = ".geojson") -> Path:
+    return OUT_DIR / f"{base_name}_{float(tolerance):g}{suffix}"
+
+
+def _write_level(topo, base_name: str, tol: float) -> tuple[str, str, str]:
+    """Simplify the topology at `tol` and write its TopoJSON + GeoJSON files."""
+    topology = topo.toposimplify(tol, prevent_oversimplify=True).to_dict()
+
+    topo_path = level_path(base_name, tol, ".topojson")
+    topo_path.write_text(json.dumps(topology, separators=(",", ":"), default=float), encoding="utf-8")
+
+    geojson = topojson_to_geojson(topology, base_name)
+    for feature in geojson["features"]:
+        feature["bbox"] = geometry_bbox(feature["geometry"])
+
+    geo_path = level_path(base_name, tol)
+    geo_path.write_text(json.dumps(geojson, separators=(",", ":")), encoding="utf-8")
+
+    print(
+        f"   -> {topo_path.name} ({topo_path.stat().st_size / 1024:.0f} KB), "
+        f"{geo_path.name} ({geo_path.stat().st_size / 1024:.0f} KB)"
+    )
+    return f"{float(tol):g}", topo_path.name, geo_path.name
+
+
+def save_geojson_levels(
+    gdf: gpd.GeoDataFrame, base_name: str, levels: tuple[float, ...] = GEOJSON_LEVELS
+) -> dict:
+    """
+    Write one TopoJSON + one compact GeoJSON per simplification level and
+    return the layer's manifest entries. `gdf` should be the full-resolution
+    (fixed) geometry.
+
+    The topology is built once; toposimplify() simplifies each shared arc once,
+    so borders stay identical on both sides. Levels are written in parallel
+    (each toposimplify works on its own copy of the topology).
+    """
+    import topojson as tp  # build-time dependency only
+
+    gdf = crop_to_sweden(gdf).reset_index(drop=True)
+    topo = tp.Topology(gdf, prequantize=QUANTIZATION, object_name=base_name)
+
+    with ThreadPoolExecutor(max_workers=len(levels)) as pool:
+        written = list(pool.map(lambda tol: _write_level(topo, base_name, tol), levels))
+
+    return {
+        "geojson": {key: geo for key, _, geo in written},
+        "topojson": {key: topo_name for key, topo_name, _ in written},
+        "lod": zoom_pyramid(list(levels)),
+    }
 
 
 def pick_col(gdf: gpd.GeoDataFrame, candidates: list[str]) -> str | None:
@@ -70,7 +162,7 @@ def save_outputs(gdf: gpd.GeoDataFrame, base_name: str) -> None:
 # -------------------------
 # Main processors
 # -------------------------
-def process_kommuner(simplify_tolerance: float = 0.003) -> None:
+def process_kommuner(simplify_tolerance: float = 0.003) -> dict:
     in_path = RAW_DIR / "kommuner.geojson"
     if not in_path.exists():
         raise FileNotFoundError(f"Missing file: {in_path}")
@@ -102,18 +194,17 @@ def process_kommuner(simplify_tolerance: float = 0.003) -> None:
     if lan_col is not None:
         gdf["lan_kod"] = gdf[lan_col].astype(str).str.replace(r"\D", "", regex=True).str.zfill(2)
 
-    # Simplify and keep minimal set
-    gdf_s = simplify(gdf, simplify_tolerance)
-
     keep = ["kommun", "kommun_kod", "geometry"]
-    if "lan_kod" in gdf_s.columns:
+    if "lan_kod" in gdf.columns:
         keep.insert(2, "lan_kod")  # kommun, kommun_kod, lan_kod, geometry
 
-    gdf_s = gdf_s[keep]
+    # Simplify and keep minimal set
+    gdf_s = simplify(gdf, simplify_tolerance)[keep]
     save_outputs(gdf_s, "kommuner")
+    return save_geojson_levels(gdf[keep], "kommuner")
 
 
-def process_lan(simplify_tolerance: float = 0.003) -> None:
+def process_lan(simplify_tolerance: float = 0.003) -> dict:
     in_path = RAW_DIR / "lan.geojson"
     if not in_path.exists():
         raise FileNotFoundError(f"Missing file: {in_path}")
@@ -142,8 +233,80 @@ def process_lan(simplify_tolerance: float = 0.003) -> None:
     gdf_s = simplify(gdf, simplify_tolerance)
     gdf_s = gdf_s[["lan", "lan_kod", "geometry"]]
     save_outputs(gdf_s, "lan")
+    return save_geojson_levels(gdf[["lan", "lan_kod", "geometry"]], "lan")
+
+
+# -------------------------
+# Incremental, parallel build
+# -------------------------
+LAYERS = {
+    "kommuner": ("kommuner.geojson", process_kommuner),
+    "lan": ("lan.geojson", process_lan),
+}
+
+
+def source_hash(in_path: Path, simplify_tolerance: float) -> str:
+    """Hash of the raw file + every setting that affects the outputs."""
+    h = hashlib.sha256(in_path.read_bytes())
+    settings = {
+        "version": BUILD_VERSION,
+        "simplify_tolerance": simplify_tolerance,
+        "levels": list(GEOJSON_LEVELS),
+        "quantization": QUANTIZATION,
+        "bbox": list(SWEDEN_BBOX),
+    }
+    h.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _outputs_exist(layer: str, manifest: dict) -> bool:
+    files = [f"{layer}_simplified.geojson", f"{layer}.parquet"]
+    for kind in ("geojson", "topojson"):
+        entries = manifest.get(kind, {}).get(layer)
+        if not entries:
+            return False
+        files.extend(entries.values())
+    return all((OUT_DIR / f).exists() for f in files)
+
+
+def build(simplify_tolerance: float = 0.003, force: bool = False) -> dict:
+    """
+    Rebuild the layers whose raw GeoJSON (or build settings) changed, in
+    parallel processes, and write the manifest once at the end.
+    """
+    manifest = json.loads(MANIFEST_FILE.read_text(encoding="utf-8")) if MANIFEST_FILE.exists() else {}
+    sources = manifest.setdefault("sources", {})
+
+    todo = {}
+    for layer, (raw_name, _) in LAYERS.items():
+        in_path = RAW_DIR / raw_name
+        if not in_path.exists():
+            raise FileNotFoundError(f"Missing file: {in_path}")
+        digest = source_hash(in_path, simplify_tolerance)
+        if not force and sources.get(layer) == digest and _outputs_exist(layer, manifest):
+            print(f"⏭️  {layer}: unchanged ({digest[:12]}), skipping")
+            continue
+        todo[layer] = digest
+
+    if not todo:
+        return manifest
+
+    with ProcessPoolExecutor(max_workers=len(todo)) as pool:
+        futures = {
+            layer: pool.submit(LAYERS[layer][1], simplify_tolerance)
+            for layer in todo
+        }
+        for layer, future in futures.items():
+            for kind, entries in future.result().items():
+                manifest.setdefault(kind, {})[layer] = entries
+            sources[layer] = todo[layer]
+
+    MANIFEST_FILE.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
 
 
 if __name__ == "__main__":
-    process_kommuner(simplify_tolerance=0.003)
-    process_lan(simplify_tolerance=0.003)
+    parser = argparse.ArgumentParser(description="Build the processed map geometry.")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the raw files are unchanged")
+    args = parser.parse_args()
+    build(simplify_tolerance=0.003, force=args.force)
@@ -0,0 +1,221 @@
+"""
+Local basemap tiles for the choropleth maps (stdlib only).
+
+By default both maps draw on mapbox_style="carto-positron", so every render
+pulls base tiles from Carto's CDN: slow on a cold browser cache and blank on
+hosts without internet. This module seeds the same light basemap as raster
+tiles for Sweden's extent into a local directory and serves it over HTTP:
+
+    python -m app.geo.tiles seed                 # zoom 3-9, ~2k tiles, resumable
+    python -m app.geo.tiles serve --port 8090    # http://127.0.0.1:8090/{z}/{x}/{y}.png
+
+and the maps switch to it through the environment:
+
+    BASEMAP_TILE_URL=http://127.0.0.1:8090/{z}/{x}/{y}.png
+
+Plotly's raster layers use 256-px tiles, so a map at zoom z loads tile zoom
+~z+1: the map zooms of app/geo/lod.py (3-8) need tile zooms 3-9.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import re
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+try:
+    from geo import lod  # streamlit run app/app_karta.py
+except ImportError:
+    from app.geo import lod
+
+TILE_DIR = Path(os.getenv("BASEMAP_TILE_DIR", "").strip() or Path(__file__).resolve().parent / "tiles")
+UPSTREAM_URL = os.getenv(
+    "BASEMAP_TILE_UPSTREAM", "https://basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png"
+).strip()
+# empty -> the remote carto-positron style
+BASEMAP_TILE_URL = os.getenv("BASEMAP_TILE_URL", "").strip()
+ATTRIBUTION = "© OpenStreetMap contributors © CARTO"
+
+# a little wider than Sweden so panning at the edges stays filled
+SEED_BBOX = (8.0, 54.0, 27.0, 70.5)
+SEED_ZOOMS = range(lod.MIN_ZOOM, lod.MAX_ZOOM + 2)
+
+_TILE_PATH = re.compile(r"^/(?:tiles/)?(\d{1,2})/(\d+)/(\d+)\.png$")
+
+
+def basemap_layout(tile_url: str | None = None) -> dict:
+    """
+    Layout arguments for a mapbox figure: the local raster tiles on a white
+    background when a tile URL is configured, the remote style otherwise.
+    """
+    url = BASEMAP_TILE_URL if tile_url is None else tile_url
+    if not url:
+        return {"mapbox_style": "carto-positron"}
+    return {
+        "mapbox_style": "white-bg",
+        "mapbox_layers": [
+            {"below": "traces", "sourcetype": "raster", "source": [url], "sourceattribution": ATTRIBUTION}
+        ],
+    }
+
+
+def tile_xy(lon: float, lat: float, z: int) -> tuple[int, int]:
+    """XYZ (web mercator) tile containing (lon, lat) at zoom z."""
+    n = 2 ** z
+    lat_r = math.radians(max(min(lat, 85.0511), -85.0511))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_r)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_for_bbox(bbox, zooms) -> list[tuple[int, int, int]]:
+    """(z, x, y) of every tile covering bbox (lon_min, lat_min, lon_max, lat_max)."""
+    xmin, ymin, xmax, ymax = bbox
+    tiles = []
+    for z in zooms:
+        x0, y0 = tile_xy(xmin, ymax, z)  # tile rows grow southwards
+        x1, y1 = tile_xy(xmax, ymin, z)
+        tiles.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    return tiles
+
+
+def tile_path(z: int, x: int, y: int, tile_dir: Path = TILE_DIR) -> Path:
+    return tile_dir / str(z) / str(x) / f"{y}.png"
+
+
+def fetch_tile(z: int, x: int, y: int, tile_dir: Path = TILE_DIR, upstream: str = UPSTREAM_URL) -> Path | None:
+    """Download one tile into the cache (atomic write). None when the upstream fails."""
+    path = tile_path(z, x, y, tile_dir)
+    req = urllib.request.Request(
+        upstream.format(z=z, x=x, y=y), headers={"User-Agent": "skolverket-dashboard tile seeder"}
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=20) as resp:
+            data = resp.read()
+    except OSError:
+        return None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+    return path
+
+
+def seed(
+    bbox=SEED_BBOX,
+    zooms=SEED_ZOOMS,
+    tile_dir: Path = TILE_DIR,
+    workers: int = 8,
+    force: bool = False,
+) -> dict:
+    """
+    Fill the cache for bbox x zooms. Tiles already on disk are skipped, so an
+    interrupted run just continues. Returns counts of fetched/skipped/failed.
+    """
+    wanted = tiles_for_bbox(bbox, zooms)
+    todo = wanted if force else [t for t in wanted if not tile_path(*t, tile_dir).exists()]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda t: fetch_tile(*t, tile_dir=tile_dir), todo))
+    failed = sum(r is None for r in results)
+    return {
+        "tiles": len(wanted),
+        "fetched": len(todo) - failed,
+        "skipped": len(wanted) - len(todo),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - t0, 1),
+    }
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    """GET /{z}/{x}/{y}.png (optionally under /tiles/) from the cache directory."""
+
+    tile_dir: Path = TILE_DIR
+    fetch_missing = False
+
+    def do_GET(self) -> None:
+        m = _TILE_PATH.match(self.path.split("?", 1)[0])
+        if m is None:
+            self.send_error(404)
+            return
+        z, x, y = (int(v) for v in m.groups())
+        path = tile_path(z, x, y, self.tile_dir)
+        if not path.exists() and self.fetch_missing:
+            fetch_tile(z, x, y, tile_dir=self.tile_dir)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self.send_error(404)
+            return
+
+        etag = f'"{z}-{x}-{y}-{path.stat().st_mtime_ns:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self._common_headers(etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self._common_headers(etag)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _common_headers(self, etag: str) -> None:
+        # mapbox-gl fetches tiles cross-origin from the dashboard page
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "public, max-age=604800")
+        self.send_header("ETag", etag)
+
+    def log_message(self, format, *args) -> None:  # noqa: A002 - BaseHTTPRequestHandler signature
+        pass
+
+
+def serve(host: str = "127.0.0.1", port: int = 8090, tile_dir: Path = TILE_DIR, fetch_missing: bool = False) -> None:
+    handler = type("Handler", (TileHandler,), {"tile_dir": tile_dir, "fetch_missing": fetch_missing})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"✅ basemap tiles from {tile_dir} on http://{host}:{port}/{{z}}/{{x}}/{{y}}.png")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main() -> None:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--tile-dir", default=str(TILE_DIR))
+
+    parser = argparse.ArgumentParser(description="Seed and serve local basemap tiles for the maps.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_seed = sub.add_parser("seed", parents=[common], help="download the tiles for Sweden into the cache")
+    p_seed.add_argument("--min-zoom", type=int, default=SEED_ZOOMS.start)
+    p_seed.add_argument("--max-zoom", type=int, default=SEED_ZOOMS.stop - 1)
+    p_seed.add_argument("--workers", type=int, default=8)
+    p_seed.add_argument("--force", action="store_true", help="re-download tiles already cached")
+
+    p_serve = sub.add_parser("serve", parents=[common], help="serve the cached tiles over HTTP")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8090)
+    p_serve.add_argument("--fetch-missing", action="store_true", help="fill cache misses from the upstream")
+
+    args = parser.parse_args()
+    tile_dir = Path(args.tile_dir)
+
+    if args.cmd == "seed":
+        stats = seed(zooms=range(args.min_zoom, args.max_zoom + 1), tile_dir=tile_dir,
+                     workers=args.workers, force=args.force)
+        print(f"✅ tiles -> {tile_dir}: {stats}")
+    else:
+        serve(args.host, args.port, tile_dir, args.fetch_missing)
+
+
+if __name__ == "__main__":
+    main()
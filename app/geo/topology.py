@@ -0,0 +1,86 @@
+"""
+Minimal TopoJSON decoder (stdlib only).
+
+app/geo/preprocess_geo.py stores the map layers as TopoJSON: every border is one
+shared arc, coordinates are quantized to an integer grid and delta-encoded.
+Plotly only draws GeoJSON, so both dashboards decode the topology here once
+per process. Neighbours are rebuilt from the same arcs, so simplified levels
+have no gaps or overlaps between municipalities.
+
+Spec: https://github.com/topojson/topojson-specification
+"""
+from __future__ import annotations
+
+
+def decode_arcs(topology: dict, precision: int = 5) -> list[list[list[float]]]:
+    """Absolute lon/lat positions for every arc (undoes delta encoding + quantization)."""
+    transform = topology.get("transform")
+    arcs = topology.get("arcs", [])
+    if transform is None:
+        return [[[round(x, precision), round(y, precision)] for x, y, *_ in arc] for arc in arcs]
+
+    kx, ky = transform["scale"]
+    tx, ty = transform["translate"]
+    decoded = []
+    for arc in arcs:
+        x = y = 0
+        points = []
+        for dx, dy, *_ in arc:
+            x += dx
+            y += dy
+            points.append([round(x * kx + tx, precision), round(y * ky + ty, precision)])
+        decoded.append(points)
+    return decoded
+
+
+def _line(arc_ids: list[int], arcs: list[list[list[float]]]) -> list[list[float]]:
+    points: list[list[float]] = []
+    for i in arc_ids:
+        arc = arcs[i] if i >= 0 else arcs[~i][::-1]
+        # consecutive arcs share their end/start point
+        points.extend(arc[1:] if points else arc)
+    return points
+
+
+def _geometry(geom: dict, arcs: list[list[list[float]]]) -> dict | None:
+    gtype = geom.get("type")
+    if gtype is None:
+        return None
+    if gtype == "Polygon":
+        return {"type": gtype, "coordinates": [_line(ring, arcs) for ring in geom["arcs"]]}
+    if gtype == "MultiPolygon":
+        return {
+            "type": gtype,
+            "coordinates": [[_line(ring, arcs) for ring in poly] for poly in geom["arcs"]],
+        }
+    if gtype == "LineString":
+        return {"type": gtype, "coordinates": _line(geom["arcs"], arcs)}
+    if gtype == "MultiLineString":
+        return {"type": gtype, "coordinates": [_line(line, arcs) for line in geom["arcs"]]}
+    if gtype in ("Point", "MultiPoint"):
+        return {"type": gtype, "coordinates": geom["coordinates"]}
+    raise ValueError(f"Unsupported TopoJSON geometry type: {gtype}")
+
+
+def topojson_to_geojson(topology: dict, object_name: str | None = None, precision: int = 5) -> dict:
+    """
+    FeatureCollection for one object of `topology` (the first one if not given).
+    Coordinates are rounded to `precision` decimals (5 ≈ 1 m, finer than the
+    quantization grid).
+    """
+    objects = topology["objects"]
+    obj = objects[object_name] if object_name else next(iter(objects.values()))
+    arcs = decode_arcs(topology, precision)
+
+    geometries = obj["geometries"] if obj.get("type") == "GeometryCollection" else [obj]
+    features = []
+    for geom in geometries:
+        feature = {
+            "type": "Feature",
+            "properties": geom.get("properties", {}),
+            "geometry": _geometry(geom, arcs),
+        }
+        if "id" in geom:
+            feature["id"] = geom["id"]
+        features.append(feature)
+    return {"type": "FeatureCollection", "features": features}
@@ -0,0 +1,301 @@
+"""
+Concurrent-session load test for the Taipy dashboard callbacks.
+
+Simulates N browser sessions inside one process, calling the same callbacks
+Taipy calls (on_init, on_navigate, on_change_*) on a recording state object.
+Each session navigates the pages and makes randomized selector changes on
+trend, fairness and parent choice. A fixed seed gives the same sessions on
+every run, so results can be compared before/after a change.
+
+    python -m app.loadtest --sessions 50 --concurrency 50 --actions 20 --seed 1 --out loadtest.json
+
+Reports p50/p95/p99 callback latency per callback, payload bytes assigned to
+figures per callback, process CPU time/utilization and peak RSS.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import resource
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import backend.data_processing as dp
+from backend import queries
+from backend.db import data_generation, mirror_status
+from backend.figure_cache import figure_cache
+from backend.figure_transport import payload_size
+from backend.updates import (
+    on_change_fairness,
+    on_change_karta,
+    on_change_parent_choice,
+    on_change_trend,
+)
+from app.main import on_init, on_navigate
+
+PAGES = [
+    "home",
+    "results-over-time",
+    "Gender-Gap",
+    "School-Choice",
+    "HighSchool-Eligibility",
+    "Budget-map",
+]
+
+STATE_VARS = [
+    "trend_kommun_lov",
+    "trend_year", "trend_lan", "trend_kommun", "trend_huvudman", "trend_subject",
+    "trend_metric", "trend_fig",
+    "fair_year", "fair_lan", "fair_huvudman", "fair_subject", "fair_fig", "fair_table",
+    "parent_choice_year", "parent_choice_lan", "parent_choice_top_n",
+    "parent_choice_fig_stack", "parent_choice_fig_trend", "parent_choice_table",
+    "beh_fig",
+    "karta_level", "karta_lan", "karta_fig", "karta_top_fig", "karta_bot_fig",
+]
+
+TOP_N_LOV = [5, 10, 20, 30]
+
+# payload size per figure object (figures are shared through the figure cache)
+_PAYLOAD_SIZES: dict[int, tuple[object, int]] = {}
+_PAYLOAD_LOCK = threading.Lock()
+
+
+def _figure_bytes(value) -> int:
+    if value is None or not hasattr(value, "to_json"):
+        return 0
+    with _PAYLOAD_LOCK:
+        hit = _PAYLOAD_SIZES.get(id(value))
+        if hit is not None and hit[0] is value:
+            return hit[1]
+    size = payload_size(value)
+    with _PAYLOAD_LOCK:
+        _PAYLOAD_SIZES[id(value)] = (value, size)
+    return size
+
+
+class SimState:
+    """Stand-in for a Taipy State: plain attributes + payload accounting."""
+
+    def __init__(self):
+        object.__setattr__(self, "payload_bytes", 0)
+        for name in STATE_VARS:
+            object.__setattr__(self, name, getattr(dp, name))
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, "payload_bytes", self.payload_bytes + _figure_bytes(value))
+
+
+class Recorder:
+    def __init__(self):
+        self.latency_ms: dict[str, list[float]] = defaultdict(list)
+        self.payload: dict[str, list[int]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def call(self, name: str, state: SimState, fn, *args):
+        before = state.payload_bytes
+        t0 = time.perf_counter()
+        fn(state, *args)
+        dt = (time.perf_counter() - t0) * 1000.0
+        with self._lock:
+            self.latency_ms[name].append(dt)
+            self.payload[name].append(state.payload_bytes - before)
+
+
+class MemorySampler(threading.Thread):
+    """Peak RSS of this process (psutil if available, else ru_maxrss)."""
+
+    def __init__(self, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        try:
+            import psutil
+            self._proc = psutil.Process(os.getpid())
+        except ImportError:
+            self._proc = None
+
+    def run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        if self._proc is not None:
+            rss = self._proc.memory_info().rss / (1024 * 1024)
+        else:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.peak_mb = max(self.peak_mb, rss)
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+        self.sample()
+
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    i = min(len(s) - 1, max(0, int(round(q / 100.0 * (len(s) - 1)))))
+    return s[i]
+
+
+def _random_action(rng: random.Random, state: SimState, page: str):
+    """One selector change on the current page -> (callback name, fn) or None."""
+    if page == "results-over-time":
+        var, lov = rng.choice([
+            ("trend_lan", dp.lan_list),
+            ("trend_kommun", state.trend_kommun_lov),
+            ("trend_huvudman", dp.huvudman_list),
+            ("trend_subject", dp.subject_list),
+        ])
+        setattr(state, var, rng.choice(lov))
+        return "on_change_trend", on_change_trend
+
+    if page == "Gender-Gap":
+        var, lov = rng.choice([
+            ("fair_year", dp.years),
+            ("fair_lan", dp.lan_list),
+            ("fair_huvudman", dp.huvudman_list),
+            ("fair_subject", dp.subject_list),
+        ])
+        setattr(state, var, rng.choice(lov))
+        return "on_change_fairness", on_change_fairness
+
+    if page == "School-Choice":
+        var, lov = rng.choice([
+            ("parent_choice_year", dp.parent_choice_years),
+            ("parent_choice_lan", dp.lan_list),
+            ("parent_choice_top_n", TOP_N_LOV),
+        ])
+        setattr(state, var, rng.choice(lov))
+        return "on_change_parent_choice", on_change_parent_choice
+
+    if page == "Budget-map":
+        var, lov = rng.choice([
+            ("karta_level", dp.KARTA_LEVELS),
+            ("karta_lan", dp.karta_lan_list),
+        ])
+        setattr(state, var, rng.choice(lov))
+        return "on_change_karta", on_change_karta
+
+    return None
+
+
+def run_session(session_no: int, seed: int, actions: int, think_ms: float, rec: Recorder) -> None:
+    rng = random.Random(seed * 100_003 + session_no)
+    state = SimState()
+
+    rec.call("on_init", state, on_init)
+
+    page = rng.choice(PAGES)
+    rec.call(f"on_navigate:{page}", state, on_navigate, page)
+
+    for _ in range(actions):
+        # ~25% navigation, the rest selector changes on the current page
+        if rng.random() < 0.25:
+            page = rng.choice(PAGES)
+            rec.call(f"on_navigate:{page}", state, on_navigate, page)
+        else:
+            action = _random_action(rng, state, page)
+            if action is None:
+                page = rng.choice(PAGES[1:4])
+                rec.call(f"on_navigate:{page}", state, on_navigate, page)
+                continue
+            name, fn = action
+            rec.call(name, state, fn)
+
+        if think_ms > 0:
+            time.sleep(rng.uniform(0.5, 1.5) * think_ms / 1000.0)
+
+
+def run(sessions: int, concurrency: int, actions: int, seed: int, think_ms: float = 0.0) -> dict:
+    rec = Recorder()
+    mem = MemorySampler()
+    mem.start()
+
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_session, i, seed, actions, think_ms, rec)
+            for i in range(sessions)
+        ]
+        for f in futures:
+            f.result()
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    mem.stop()
+
+    all_latency = [v for vals in rec.latency_ms.values() for v in vals]
+    return {
+        "config": {
+            "sessions": sessions,
+            "concurrency": concurrency,
+            "actions": actions,
+            "seed": seed,
+            "think_ms": think_ms,
+            "pushdown": queries.PUSHDOWN_ENABLED,
+            "compact_dtypes": dp.COMPACT_DTYPES,
+            "duckdb_mirror": bool(mirror_status()),
+            "data_generation": data_generation(),
+        },
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_percent": round(100.0 * cpu / wall, 1) if wall else 0.0,
+        "rss_peak_mb": round(mem.peak_mb, 1),
+        "callbacks_total": len(all_latency),
+        "latency_ms": {
+            "all": _summary(all_latency),
+            **{name: _summary(v) for name, v in sorted(rec.latency_ms.items())},
+        },
+        "payload_bytes": {
+            name: {
+                "p50": _pct(v, 50),
+                "p95": _pct(v, 95),
+                "max": max(v) if v else 0,
+                "total": sum(v),
+            }
+            for name, v in sorted(rec.payload.items())
+        },
+        "figure_cache": figure_cache.stats(),
+    }
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": round(_pct(values, 50), 2),
+        "p95": round(_pct(values, 95), 2),
+        "p99": round(_pct(values, 99), 2),
+        "max": round(max(values), 2) if values else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the dashboard callbacks with simulated sessions.")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--actions", type=int, default=20, help="interactions per session")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between interactions")
+    parser.add_argument("--out", default=None, help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = run(args.sessions, args.concurrency, args.actions, args.seed, args.think_ms)
+    text = json.dumps(report, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"✅ report -> {args.out}")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import os
+
+from flask import Flask
 from taipy.gui import Gui
 from frontend.pages.home import home_page
 from frontend.pages.kpi_trend import kpi_trend_page
@@ -13,8 +16,12 @@ from backend.updates import (
     update_trend_kommun_lov,
     refresh_parent_choice,
     refresh_behorighet_gender,   # ✅ اینو اضافه کن
+    PageActivator,
+    precompute_default_figures,
 )
-from backend.data_processing import beh_fig
+from backend.data_processing import beh_fig, prewarm_in_background
+from backend.prerender import load_prerendered_in_background
+from backend.figure_transport import GEO_STATIC_DIR, GEO_URL_PREFIX
 
 from backend.data_processing import (
     # LOVs (اگر جایی لازم داری)
@@ -34,11 +41,9 @@ from backend.data_processing import (
     parent_choice_fig_stack, parent_choice_fig_trend, parent_choice_table,
 
     #karta state
-   
+    karta_level, karta_lan,
     karta_fig, karta_top_fig, karta_bot_fig,
 )
-from frontend.pages.karta import on_init as karta_on_init
-
 from frontend.pages.karta import karta_page
 
 from backend.updates import (
@@ -82,32 +87,57 @@ pages = {
 
 
 
-def on_init(state):
-    # Trend
-    update_trend_kommun_lov(state)
-    refresh_trend(state)
-
-    # Fairness
-    refresh_fairness(state)
+# Figures are computed per page, on a session's first visit to it
+page_activator = PageActivator({
+    "results-over-time": (update_trend_kommun_lov, refresh_trend),
+    "Gender-Gap": (refresh_fairness,),
+    "School-Choice": (refresh_parent_choice,),
+    "HighSchool-Eligibility": (refresh_behorighet_gender,),
+    "Budget-map": (refresh_karta,),
+})
 
-    # Parent Choice
-    refresh_parent_choice(state)
 
-  
-    refresh_behorighet_gender(state)
+def on_init(state):
+    # nothing to build up front -> see on_navigate
+    pass
 
-    karta_on_init(state)
 
-    refresh_karta(state)
+def on_navigate(state, page_name):
+    page_activator.activate(state, page_name)
+    return page_name
 
 print(">>> PLOTLY THEME LOADED <<<")
 
+# DASHBOARD_PORT: lets app/serve.py start several workers on different ports
+PORT = int(os.getenv("DASHBOARD_PORT", "8080"))
+
 
 
 if __name__ == "__main__":
-    Gui(pages=pages, css_file="assets/main.css").run(
-        port=8080,
+    # figures rendered by the pipeline's last stage for this data generation
+    load_prerendered_in_background()
+    # load marts + geo once the server is listening (first page doesn't wait for it)
+    prewarm_in_background(port=PORT, then=precompute_default_figures)
+
+    # gzip for HTTP responses (static GeoJSON etc.) when flask-compress is installed
+    flask_app = Flask(__name__)
+    try:
+        from flask_compress import Compress
+        Compress(flask_app)
+    except ImportError:
+        print("⚠️ flask-compress not installed: HTTP responses are sent uncompressed (pip install flask-compress)")
+
+    GEO_STATIC_DIR.mkdir(parents=True, exist_ok=True)
+
+    Gui(
+        pages=pages,
+        css_file="assets/main.css",
+        flask=flask_app,
+        path_mapping={GEO_URL_PREFIX: str(GEO_STATIC_DIR)},
+    ).run(
+        port=PORT,
         dark_mode=False,
         use_reloader=False,  # ✅ جلوگیری از invalid session
         on_init=on_init,
+        on_navigate=on_navigate,
     )
@@ -0,0 +1,288 @@
+"""
+Batch reports: one PNG or PDF page per kommun.
+
+Each report combines the dashboard's own figures for one kommun:
+
+- trend: Grade 9 score over time (build_trend_figure, kommun filter)
+- gender gap: the kommun's girls vs boys grade points over time (fairness
+  mart, gender_gap_figure)
+- school choice: Enskild share over time, the kommun highlighted among the
+  kommuner of its län (build_parent_choice_figures)
+- budget position: budget map of the län (build_karta_budget_figure) plus the
+  kommun's rank in Sweden in the header
+
+The marts are exported once into the Arrow mart store (backend/mart_store.py)
+and every worker process memory-maps it with pushdown off, so the trend,
+gender gap and school choice panels of the ~290 reports share one copy of the
+data. The job list (kommun_jobs) and the budget map (build_karta_budget_figure)
+still query DuckDB read-only, one short query per report. Finished reports are
+skipped on the next run, so an interrupted batch just continues.
+
+    python -m app.reports --out reports --format pdf --workers 8
+    python -m app.reports --kommun 0180 --kommun 1480 --force
+
+Needs kaleido (figure -> PNG) and Pillow (page layout, PDF).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+
+from config import BASE_DIR
+
+DEFAULT_OUT_DIR = BASE_DIR / "reports"
+PANEL_W, PANEL_H = 900, 560
+HEADER_H = 90
+HIGHLIGHT = "#d62728"
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^0-9A-Za-zÅÄÖåäö_-]+", "_", str(text)).strip("_")
+
+
+def report_path(out_dir: Path, kommun: dict, fmt: str) -> Path:
+    return out_dir / f"{kommun['kommun_kod']}_{_slug(kommun['kommun'])}.{fmt}"
+
+
+def kommun_jobs(only: list[str] | None = None) -> list[dict]:
+    """
+    One job per kommun of the latest budget year: kod, name, län and the
+    kommun's budget rank in Sweden (1 = highest spending per student).
+    """
+    from backend.data_processing import BUDGET_TABLE
+    from backend.db import query_df
+
+    df = query_df(f"""
+        with latest as (
+            select * from {BUDGET_TABLE}
+            where lasar_start = (select max(lasar_start) from {BUDGET_TABLE})
+        ), per_kommun as (
+            select kommun_kod, any_value(kommun) as kommun, any_value(lan) as lan,
+                   any_value(lasar_start) as year,
+                   sum(totalt_per_elev * genomsnittligt_elevantal)
+                       / nullif(sum(genomsnittligt_elevantal), 0) as totalt_per_elev
+            from latest
+            group by kommun_kod
+        )
+        select *,
+               rank() over (order by totalt_per_elev desc nulls last) as budget_rank,
+               count(*) over () as n_kommuner
+        from per_kommun
+        order by kommun_kod
+    """)
+    df["kommun_kod"] = df["kommun_kod"].astype(str).str.zfill(4)
+    if only:
+        wanted = {str(k).zfill(4) for k in only}
+        df = df[df["kommun_kod"].isin(wanted) | df["kommun"].isin(only)]
+    return json.loads(df.to_json(orient="records"))
+
+
+# ---------------- worker ----------------
+
+def _init_worker() -> None:
+    """Map the marts once per worker process (they stay shared through the OS page cache)."""
+    from backend.data_processing import prewarm
+
+    prewarm(include_geo=False)
+
+
+def _highlight_trace(fig, name: str):
+    """Dim every trace except the one called `name` (a copy, cached figures stay untouched)."""
+    fig = fig.__class__(fig)
+    for trace in fig.data:
+        if trace.name == name:
+            trace.update(line=dict(width=4, color=HIGHLIGHT), opacity=1.0)
+        else:
+            trace.update(line=dict(width=1, color="rgba(0,0,0,0.25)"), opacity=0.6)
+    return fig
+
+
+def _inline_geojson(fig):
+    """
+    The dashboard maps reference published GeoJSON by URL; a headless
+    renderer cannot resolve that, so put the file contents into the figure.
+    """
+    from app.geo import tiles
+    from backend.figure_transport import GEO_STATIC_DIR
+
+    fig = fig.__class__(fig)
+    for trace in fig.data:
+        geojson = getattr(trace, "geojson", None)
+        if isinstance(geojson, str):
+            trace.geojson = json.loads((GEO_STATIC_DIR / geojson.rsplit("/", 1)[-1]).read_text(encoding="utf-8"))
+    if not tiles.BASEMAP_TILE_URL:
+        # no local tiles configured: don't depend on the remote style
+        fig.update_layout(mapbox_style="white-bg", mapbox_layers=[])
+    return fig
+
+
+def gender_gap_figure(name: str, lan: str):
+    """
+    Girls vs boys average grade points of one kommun per year (all subjects
+    and huvudmän). The dashboard's fairness chart ranks the top-10 gaps of a
+    län, which need not include this kommun.
+    """
+    import plotly.express as px
+
+    from backend.data_processing import FAIR_TABLE, get_mart_index
+
+    df = get_mart_index(FAIR_TABLE).select(lan=lan, kommun=name)
+    if df.empty:
+        return None
+    per_year = (
+        df.groupby("year", as_index=False, observed=True)[["betygpoang_flickor", "betygpoang_pojkar"]]
+          .mean()
+          .rename(columns={"betygpoang_flickor": "Girls", "betygpoang_pojkar": "Boys"})
+          .melt(id_vars="year", var_name="Group", value_name="Average grade points")
+    )
+    fig = px.line(per_year, x="year", y="Average grade points", color="Group", markers=True)
+    fig.update_layout(
+        title=f"Average grade points, girls vs boys - {name}",
+        legend=dict(orientation="h", y=1.08, x=0.0, xanchor="left", title_text=""),
+    )
+    fig.update_xaxes(title_text="", dtick=1)
+    return fig
+
+
+def report_figures(kommun: dict) -> list:
+    """The four panels of one kommun's report, built with the dashboard builders."""
+    from backend.data_processing import build_karta_budget_figure
+    from backend.updates import build_parent_choice_figures, build_trend_figure
+
+    name, lan = kommun["kommun"], kommun["lan"]
+
+    trend = build_trend_figure(lan=lan, kommun=name, huvudman="All", subject="All")
+    fairness = gender_gap_figure(name, lan)
+    # top_n above the largest län (49 kommuner) -> every kommun of the län is drawn
+    _stack, choice = build_parent_choice_figures(year="All", lan=lan, top_n=100)
+    budget, _df = build_karta_budget_figure(int(kommun["year"]), "Kommun", lan)
+
+    figures = [
+        trend,
+        fairness,
+        _highlight_trace(choice, name) if choice is not None else None,
+        _inline_geojson(budget),
+    ]
+    for fig in figures:
+        if fig is not None:
+            # the dashboard draws on a transparent background
+            fig.update_layout(paper_bgcolor="white", plot_bgcolor="white")
+    return figures
+
+
+def _panel(fig):
+    from io import BytesIO
+
+    from PIL import Image
+
+    if fig is None:
+        return Image.new("RGB", (PANEL_W, PANEL_H), "white")
+    png = fig.to_image(format="png", width=PANEL_W, height=PANEL_H)
+    return Image.open(BytesIO(png)).convert("RGB")
+
+
+def render_report(kommun: dict, out_dir: str, fmt: str) -> tuple[str, float]:
+    """Build, render and write one kommun's report (atomic). -> (kommun_kod, seconds)."""
+    from PIL import Image, ImageDraw
+
+    t0 = time.perf_counter()
+    panels = [_panel(fig) for fig in report_figures(kommun)]
+
+    page = Image.new("RGB", (2 * PANEL_W, HEADER_H + 2 * PANEL_H), "white")
+    draw = ImageDraw.Draw(page)
+    draw.text((24, 18), f"{kommun['kommun']} ({kommun['kommun_kod']}) - {kommun['lan']}", fill="black")
+    budget = kommun.get("totalt_per_elev")
+    if budget is not None:
+        draw.text(
+            (24, 48),
+            f"Spending per student {kommun['year']}: {budget:,.0f} SEK "
+            f"- rank {kommun['budget_rank']} of {kommun['n_kommuner']} kommuner",
+            fill="black",
+        )
+    for i, panel in enumerate(panels):
+        page.paste(panel, ((i % 2) * PANEL_W, HEADER_H + (i // 2) * PANEL_H))
+
+    path = report_path(Path(out_dir), kommun, fmt)
+    tmp = path.with_suffix(f".tmp.{fmt}")
+    if fmt == "pdf":
+        page.save(tmp, "PDF", resolution=150)
+    else:
+        page.save(tmp, "PNG")
+    tmp.replace(path)
+    return kommun["kommun_kod"], time.perf_counter() - t0
+
+
+# ---------------- batch ----------------
+
+def run(
+    out_dir: Path = DEFAULT_OUT_DIR,
+    fmt: str = "pdf",
+    workers: int | None = None,
+    only: list[str] | None = None,
+    force: bool = False,
+    skip_export: bool = False,
+) -> dict:
+    """Render every (or the selected) kommun report that is not on disk yet."""
+    from backend.mart_store import DEFAULT_STORE_DIR, MART_STORE_DIR, export_store
+
+    store_dir = Path(MART_STORE_DIR) if MART_STORE_DIR else DEFAULT_STORE_DIR
+    if not skip_export:
+        export_store(store_dir)
+    # inherited by the workers: read the memory-mapped store, filter in pandas
+    os.environ["MART_STORE_DIR"] = str(store_dir)
+    os.environ["DASHBOARD_PUSHDOWN"] = "0"
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = kommun_jobs(only)
+    todo = [k for k in jobs if force or not report_path(out_dir, k, fmt).exists()]
+    print(f"{len(todo)} of {len(jobs)} reports to render -> {out_dir}")
+
+    t0 = time.perf_counter()
+    failed: dict[str, str] = {}
+    done = 0
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    # spawn: fresh interpreters that pick up the env above (no forked DuckDB/threads)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=_init_worker) as pool:
+        futures = {pool.submit(render_report, k, str(out_dir), fmt): k["kommun_kod"] for k in todo}
+        for fut in as_completed(futures):
+            kod = futures[fut]
+            try:
+                _kod, seconds = fut.result()
+            except Exception as e:
+                failed[kod] = str(e)
+                print(f"⚠️ {kod}: {e}")
+                continue
+            done += 1
+            print(f"   {done}/{len(todo)} {kod} ({seconds:.1f}s)")
+
+    return {
+        "reports": len(jobs),
+        "rendered": done,
+        "skipped": len(jobs) - len(todo),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - t0, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Render one report per kommun in parallel.")
+    parser.add_argument("--out", default=str(DEFAULT_OUT_DIR))
+    parser.add_argument("--format", choices=("pdf", "png"), default="pdf")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--kommun", action="append", help="kommun_kod or name (repeatable); default all")
+    parser.add_argument("--force", action="store_true", help="re-render reports already on disk")
+    parser.add_argument("--skip-export", action="store_true", help="reuse the current mart store")
+    args = parser.parse_args()
+
+    result = run(Path(args.out), args.format, args.workers, args.kommun, args.force, args.skip_export)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Multi-process serving of the Taipy dashboard.
+
+1. exports the marts + geometry once into the Arrow mart store (backend/mart_store.py)
+2. starts N dashboard workers (app/main.py) that memory-map that store read-only
+   with DASHBOARD_PUSHDOWN=0, so filters run in pandas on the shared store
+   instead of each worker querying DuckDB (as app/reports.py does)
+3. writes an nginx upstream config for a local load balancer in front of them
+
+    python -m app.serve --workers 4 --base-port 8081 --listen 8080
+    nginx -c $(pwd)/mart_store/nginx.conf
+
+ip_hash keeps a browser on the same worker, which Taipy's websocket sessions need.
+With DUCKDB_MIRROR=1 every worker still builds its own in-memory copy of the
+marts for the queries that do reach DuckDB, so budget for N copies.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from backend.mart_store import DEFAULT_STORE_DIR, export_store
+from config import BASE_DIR
+
+NGINX_TEMPLATE = """\
+worker_processes 1;
+events {{ worker_connections 4096; }}
+http {{
+    upstream skolverket_dashboard {{
+        ip_hash;
+{servers}
+    }}
+    map $http_upgrade $connection_upgrade {{
+        default upgrade;
+        ''      close;
+    }}
+    server {{
+        listen {listen};
+        gzip on;
+        gzip_types application/json application/geo+json text/css application/javascript;
+        location / {{
+            proxy_pass http://skolverket_dashboard;
+            proxy_http_version 1.1;
+            proxy_set_header Upgrade $http_upgrade;
+            proxy_set_header Connection $connection_upgrade;
+            proxy_set_header Host $host;
+        }}
+    }}
+}}
+"""
+
+
+def write_nginx_conf(path: Path, ports: list[int], listen: int) -> Path:
+    servers = "\n".join(f"        server 127.0.0.1:{p};" for p in ports)
+    path.write_text(NGINX_TEMPLATE.format(servers=servers, listen=listen), encoding="utf-8")
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the dashboard with several worker processes.")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--base-port", type=int, default=8081)
+    parser.add_argument("--listen", type=int, default=8080, help="port of the load balancer (nginx)")
+    parser.add_argument("--store-dir", default=str(DEFAULT_STORE_DIR))
+    parser.add_argument("--skip-export", action="store_true", help="reuse the current store")
+    args = parser.parse_args()
+
+    store_dir = Path(args.store_dir)
+    if not args.skip_export:
+        export_store(store_dir)
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    conf = write_nginx_conf(store_dir / "nginx.conf", ports, args.listen)
+    print(f"✅ nginx config -> {conf}")
+
+    procs: list[subprocess.Popen] = []
+    for port in ports:
+        env = os.environ.copy()
+        env["MART_STORE_DIR"] = str(store_dir)
+        env["DASHBOARD_PUSHDOWN"] = "0"
+        env["DASHBOARD_PORT"] = str(port)
+        procs.append(subprocess.Popen([sys.executable, "-m", "app.main"], cwd=str(BASE_DIR), env=env))
+        print(f"   worker pid={procs[-1].pid} port={port}")
+
+    def _stop(*_args):
+        for p in procs:
+            p.terminate()
+
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        while all(p.poll() is None for p in procs):
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _stop()
+        for p in procs:
+            p.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,258 @@
 import pandas as pd
+import numpy as np
 import json
-import geopandas as gpd
+import os
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import duckdb
 import plotly.express as px
 from backend.db import load_table
 from backend.db import query_df
+from backend.db import distinct_values
 from backend.charts import chart_behorighet_gender
+from backend.filter_index import MartIndex
+from backend.figure_cache import on_generation_change
+from backend.figure_transport import publish_geojson, publish_geojson_file, compact_numeric_arrays
+from backend.utils import is_all
+from app.geo import lod
+from app.geo.tiles import basemap_layout
+from backend import geo_artifacts, mart_store
 from pathlib import Path
 from config import BASE_DIR
 
+if TYPE_CHECKING:
+    import geopandas as gpd
+
 TREND_TABLE = "mart_parent_trend_ak9"
 CHOICE_TABLE = "mart_parent_choice_ak1_9"
 FAIR_TABLE = "mart_parent_fairness_ak9"
 
-# Load once
-trend_df = load_table(TREND_TABLE)
-choice_df = load_table(CHOICE_TABLE)
-fair_df = load_table(FAIR_TABLE)
+# ---------------- Compact dtypes per mart ----------------
+# The frames live for the whole process (one copy per dashboard worker), so
+# text columns become categoricals and numbers the smallest dtype that fits.
+# This only matters where marts are held as frames: the pandas path
+# (DASHBOARD_PUSHDOWN=0) and the Arrow mart store that app/serve.py and
+# app/reports.py export. With pushdown on, the callbacks query DuckDB.
+# DASHBOARD_COMPACT_DTYPES=0 keeps the default pandas dtypes.
+COMPACT_DTYPES = os.getenv("DASHBOARD_COMPACT_DTYPES", "1").strip().lower() not in ("0", "false", "no")
+
+_KPI_COMMON_SCHEMA = {
+    "kommun": "category",
+    "lan": "category",
+    "subject": "category",
+    "huvudman_typ": "category",
+    "year": "int16",
+    "score": "float32",
+    "rank_sweden": "int16",
+    "rank_lan": "int16",
+    "betygspoang_totalt": "float32",
+    "betygpoang_flickor": "float32",
+    "betygpoang_pojkar": "float32",
+    "betygpoang_gap_f_minus_m": "float32",
+}
+
+MART_SCHEMAS: dict[str, dict[str, str]] = {
+    TREND_TABLE: {
+        **_KPI_COMMON_SCHEMA,
+        "performance_bucket": "category",
+        "trend_label": "category",
+        "score_prev_year": "float32",
+        "score_change_yoy": "float32",
+        "rank_sweden_prev_year": "int16",
+        "rank_sweden_change_yoy": "int16",
+        "rank_lan_prev_year": "int16",
+        "rank_lan_change_yoy": "int16",
+    },
+    FAIR_TABLE: {
+        **_KPI_COMMON_SCHEMA,
+        "gap_abs": "float32",
+        "fairness_score": "float32",
+        "fairness_rank_sweden": "int16",
+        "fairness_rank_lan": "int16",
+        "fairness_label": "category",
+    },
+    CHOICE_TABLE: {
+        "year": "int16",
+        "kommun": "category",
+        "lan": "category",
+        "huvudman_typ": "category",
+        "n_students": "int32",
+        "n_total": "int32",
+        "share": "float32",
+    },
+}
+
+
+def compact_frame(df: pd.DataFrame, schema: dict[str, str]) -> pd.DataFrame:
+    """
+    Cast columns in place according to `schema`.
+    Integer columns with nulls get the nullable variant (int16 -> Int16);
+    integer columns whose values don't fit the target type are left as they are.
+    """
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        s = df[col]
 
-# ---------------- Parent Choice LOVs ----------------
+        if dtype.startswith("int"):
+            values = pd.to_numeric(s, errors="coerce")
+            if values.notna().any():
+                info = np.iinfo(dtype)
+                if values.min() < info.min or values.max() > info.max:
+                    continue
+            if values.isna().any():
+                dtype = dtype.capitalize()  # nullable: Int16 / Int32
+            s = values
 
-# Year LOV (ONLY from parent choice data, safe as strings)
-parent_choice_years = ["All"] + sorted(
-    choice_df["year"].dropna().astype(int).astype(str).unique().tolist()
-)
+        try:
+            df[col] = s.astype(dtype)
+        except (TypeError, ValueError):
+            pass
+    return df
+
+
+def _frame_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def load_mart(table: str) -> pd.DataFrame:
+    """
+    Read a mart and (optionally) shrink it to its compact schema.
+    With MART_STORE_DIR set, the memory-mapped Arrow store is used instead of DuckDB.
+    """
+    if mart_store.STORE_ENABLED:
+        df = mart_store.read_table(table)
+        if df is not None:
+            return df
+
+    df = load_table(table)
+    schema = MART_SCHEMAS.get(table)
+    if COMPACT_DTYPES and schema:
+        df = compact_frame(df, schema)
+    return df
+
+
+# ---------------- Mart frames (lazy) ----------------
+# Marts are loaded on first access (or by prewarm()), so importing this module
+# (and every page that imports it) doesn't pay for loading all marts up front.
+
+_MART_FRAMES: dict[str, pd.DataFrame] = {}
+_MART_LOCK = threading.Lock()
+
+_LAZY_FRAMES = {
+    "trend_df": TREND_TABLE,
+    "choice_df": CHOICE_TABLE,
+    "fair_df": FAIR_TABLE,
+}
+
+
+def get_mart(table: str) -> pd.DataFrame:
+    """Load a mart once per process and return the shared frame."""
+    df = _MART_FRAMES.get(table)
+    if df is not None:
+        return df
+
+    with _MART_LOCK:
+        df = _MART_FRAMES.get(table)
+        if df is None:
+            df = load_mart(table)
+            _MART_FRAMES[table] = df
+    return df
+
+
+_MART_INDEXES: dict[str, MartIndex] = {}
+
+
+def get_mart_index(table: str) -> MartIndex:
+    """Row-position index over the resident mart frame (pandas path, built once per process)."""
+    idx = _MART_INDEXES.get(table)
+    if idx is not None:
+        return idx
+
+    df = get_mart(table)
+    with _MART_LOCK:
+        idx = _MART_INDEXES.get(table)
+        if idx is None or idx.df is not df:
+            idx = MartIndex(df)
+            _MART_INDEXES[table] = idx
+    return idx
+
+
+@on_generation_change
+def release_marts() -> None:
+    """
+    Drop the resident frames and their indexes after a pipeline run; they are
+    reloaded (from the store or DuckDB) on next access. The DuckDB mirror
+    rebuilds itself on a new generation (backend/db.py).
+    """
+    with _MART_LOCK:
+        _MART_FRAMES.clear()
+        _MART_INDEXES.clear()
+    mart_store.release_tables()
+
+
+def get_trend_df() -> pd.DataFrame:
+    return get_mart(TREND_TABLE)
+
+
+def get_choice_df() -> pd.DataFrame:
+    return get_mart(CHOICE_TABLE)
+
+
+def get_fair_df() -> pd.DataFrame:
+    return get_mart(FAIR_TABLE)
+
+
+def __getattr__(name: str):
+    # `data_processing.trend_df` etc. still work, they just load on first access
+    if name in _LAZY_FRAMES:
+        return get_mart(_LAZY_FRAMES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def prewarm(include_geo: bool = True) -> None:
+    """Load all marts (and optionally the kommun geometry) into the process caches."""
+    frames = [get_mart(table) for table in _LAZY_FRAMES.values()]
+    print(f"✅ {len(frames)} marts resident: {sum(_frame_mb(df) for df in frames):.1f} MB")
+    if include_geo:
+        geojson_url_simplified(geo_artifacts.level_for_zoom(DEFAULT_ZOOM) or mart_store.GEOJSON_TOLERANCE)
+
+
+def prewarm_in_background(
+    port: int | None = None,
+    host: str = "127.0.0.1",
+    timeout: float = 60.0,
+    then=None,
+) -> threading.Thread:
+    """
+    Run prewarm() in a daemon thread.
+    If `port` is given, wait until the server accepts connections first, so
+    warm-up never delays the server start. `then` (optional) runs after the
+    data is loaded, e.g. to precompute default figures.
+    """
+    def _run() -> None:
+        if port is not None:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                try:
+                    with socket.create_connection((host, int(port)), timeout=0.5):
+                        break
+                except OSError:
+                    time.sleep(0.2)
+        try:
+            prewarm()
+            if then is not None:
+                then()
+        except Exception as e:
+            print(f"⚠️ prewarm failed: {e}")
+
+    t = threading.Thread(target=_run, name="mart-prewarm", daemon=True)
+    t.start()
+    return t
 
-# Kommun LOV for trend selector (from parent choice data)
-#parent_choice_kommun_trend_lov = ["All"] + sorted(
-#    choice_df["kommun"].dropna().unique().tolist()
-#)
 
 # ---------------- Common LOV helper ----------------
 
@@ -42,13 +267,39 @@ def _lov(df: pd.DataFrame, col: str):
     return ["All"] + vals
 
 
+def _lov_db(table: str, col: str) -> list:
+    """
+    Same as _lov(), but runs SELECT DISTINCT in DuckDB instead of loading the mart.
+    Runs at import time: a missing table, database file or unreachable query
+    server gives ["All"] instead of breaking every module importing this one.
+    """
+    try:
+        vals = distinct_values(table, col, limit=5000)
+    except (duckdb.Error, OSError) as e:
+        print(f"⚠️ LOV {table}.{col} unavailable: {e}")
+        return ["All"]
+    return ["All"] + vals
+
+
+# ---------------- Parent Choice LOVs ----------------
+
+# Year LOV (ONLY from parent choice data, safe as strings)
+parent_choice_years = ["All"] + sorted(
+    {str(int(y)) for y in _lov_db(CHOICE_TABLE, "year")[1:]}
+)
+
+# Kommun LOV for trend selector (from parent choice data)
+#parent_choice_kommun_trend_lov = ["All"] + sorted(
+#    choice_df["kommun"].dropna().unique().tolist()
+#)
+
 # ---------------- Common LOVs (other pages) ----------------
 
-years = _lov(trend_df, "year")
-lan_list = _lov(trend_df, "lan")
-kommun_list = _lov(trend_df, "kommun")
-huvudman_list = _lov(trend_df, "huvudman_typ")
-subject_list = _lov(trend_df, "subject")
+years = _lov_db(TREND_TABLE, "year")
+lan_list = _lov_db(TREND_TABLE, "lan")
+kommun_list = _lov_db(TREND_TABLE, "kommun")
+huvudman_list = _lov_db(TREND_TABLE, "huvudman_typ")
+subject_list = _lov_db(TREND_TABLE, "subject")
 subject_list = ["All"] + sorted({s for s in subject_list if str(s).strip().lower() != "all"})
 
 # ---------------- Parent Choice state ----------------
@@ -87,15 +338,13 @@ fair_fig = None
 fair_table = None
 
 #----------------Behörighet state ----------------
-from backend.db import get_connection
 
 def load_mart_behorighet_national_gender():
-    con = get_connection()
-    return con.execute("""
+    return query_df("""
         select kon, program, behorighet_pct
         from mart_behorighet_national_gender_2024_25
         order by program, kon
-    """).df()
+    """)
 
 
 # Figure state
@@ -127,6 +376,16 @@ GEO_KOMMUN_PARQUET = BASE_DIR / "app" / "geo" / "processed" / "kommuner.parquet"
 DEFAULT_CENTER = {"lat": 62.0, "lon": 15.0}
 DEFAULT_ZOOM = 4.3
 
+# Map level: one shape per kommun, or the 21 pre-built län shapes
+# (values from the precomputed mart_budget_per_elev_lan).
+KARTA_LEVELS = ["Kommun", "Län"]
+BUDGET_TABLE = "mart_budget_per_elev_kommun"
+BUDGET_LAN_TABLE = "mart_budget_per_elev_lan"
+
+karta_level = "Kommun"
+karta_lan = "All"  # drill-down: kommuner of one län
+karta_lan_list = _lov_db(BUDGET_TABLE, "lan")
+
 # Figures (optional globals, if you use them elsewhere)
 karta_fig = None
 karta_top_fig = None
@@ -137,11 +396,14 @@ karta_bot_fig = None
 # -------------------------
 _geo_base_cache = None
 
-def load_kommun_geo_base() -> gpd.GeoDataFrame:
+def load_kommun_geo_base() -> "gpd.GeoDataFrame":
     global _geo_base_cache
     if _geo_base_cache is not None:
         return _geo_base_cache
 
+    # geopandas is heavy to import -> only when the map is actually needed
+    import geopandas as gpd
+
     if not GEO_KOMMUN_PARQUET.exists():
         raise FileNotFoundError(f"Geo parquet saknas: {GEO_KOMMUN_PARQUET}")
 
@@ -172,7 +434,15 @@ def geojson_from_geo_simplified(tolerance: float = 0.01) -> dict:
     """
     Returns a GeoJSON that is CROPPED to Sweden bounding box,
     so the map won't show Norway/Finland etc.
+
+    Served from the precomputed artifacts (app/geo/preprocess_geo.py) when they
+    exist; the geopandas path below is only the fallback for a missing build.
+    The returned dict is shared -> do not mutate it.
     """
+    prebuilt = geo_artifacts.load_geojson("kommuner", tolerance)
+    if prebuilt is not None:
+        return prebuilt
+
     gdf = load_kommun_geo_base().copy()
 
     # 🔒 Crop to Sweden bounding box (lon: 10.5–24.5, lat: 55.0–69.5)
@@ -188,54 +458,140 @@ def geojson_from_geo_simplified(tolerance: float = 0.01) -> dict:
     return json.loads(gdf.to_json())
 
 
+_geojson_url_cache: dict[tuple[str, float], str] = {}
+
+
+def geojson_url_simplified(tolerance: float = 0.01, layer: str = "kommuner") -> str:
+    """URL of the published (static, browser-cached) GeoJSON for this layer/tolerance."""
+    tol = float(tolerance)
+    url = _geojson_url_cache.get((layer, tol))
+    if url is None:
+        stored = None
+        if mart_store.STORE_ENABLED and layer == "kommuner":
+            stored = mart_store.geojson_path(tol)
+        if stored is None:
+            stored = geo_artifacts.geojson_path(layer, tol)
+        if stored is not None:
+            # precomputed (store / geo build) -> no geopandas in this worker
+            url = publish_geojson_file(f"{layer}_{tol:g}", stored)
+        elif layer == "kommuner":
+            url = publish_geojson(f"{layer}_{tol:g}", geojson_from_geo_simplified(tol))
+        else:
+            raise FileNotFoundError(f"Geo-artefakt saknas för {layer}: kör python -m app.geo.preprocess_geo")
+        _geojson_url_cache[(layer, tol)] = url
+    return url
+
+
+def geojson_url_for_lan(lan_kod: str) -> tuple[str, dict, float]:
+    """
+    Drill-down view of one län: (URL of the kommuner intersecting it, center, zoom).
+    Finer level than the country view, cropped to the län -> still a small file.
+    """
+    bbox = geo_artifacts.feature_bbox("lan", "lan_kod", str(lan_kod).zfill(2))
+    if bbox is None:
+        return geojson_url_simplified(geo_artifacts.level_for_zoom(DEFAULT_ZOOM) or 0.01), DEFAULT_CENTER, DEFAULT_ZOOM
+
+    view = lod.pad_bbox(bbox)
+    zoom = lod.zoom_for_bbox(view)
+    geojson = geo_artifacts.geojson_for_view("kommuner", zoom, view)
+    tol = geo_artifacts.level_for_zoom(zoom)
+    url = publish_geojson(f"kommuner_lan{str(lan_kod).zfill(2)}_{tol:g}", geojson)
+    return url, lod.bbox_center(view), zoom
+
+
 # -------------------------
 # KARTA: budget map + top/bottom
 # -------------------------
-def build_karta_budget_figure(year: int) -> tuple["px.Figure", pd.DataFrame]:
-    table = "mart_budget_per_elev_kommun"
-
-    df = query_df(f"""
-        select kommun_kod, kommun, totalt_per_elev
-        from {table}
-        where lasar_start = {int(year)}
-    """)
+def build_karta_budget_figure(
+    year: int, level: str = "Kommun", lan: str = "All"
+) -> tuple["px.Figure", pd.DataFrame]:
+    """
+    Budget per elev choropleth.
+    - level "Län": 21 pre-built län shapes, student-weighted values per län
+    - level "Kommun": all kommuner, or (lan set) only the kommuner of that län
+    """
+    by_lan = level == "Län"
+
+    if by_lan:
+        # mart rows are per huvudman_typ -> re-weight by students across them
+        df = query_df(f"""
+            select lan_kod, lan,
+                   sum(totalt_per_elev * genomsnittligt_elevantal)
+                       / sum(genomsnittligt_elevantal) as totalt_per_elev
+            from {BUDGET_LAN_TABLE}
+            where lasar_start = ?
+            group by lan_kod, lan
+        """, [int(year)])
+    elif is_all(lan):
+        df = query_df(f"""
+            select kommun_kod, kommun, lan_kod, totalt_per_elev
+            from {BUDGET_TABLE}
+            where lasar_start = ?
+        """, [int(year)])
+    else:
+        df = query_df(f"""
+            select kommun_kod, kommun, lan_kod, totalt_per_elev
+            from {BUDGET_TABLE}
+            where lasar_start = ? and lan = ?
+        """, [int(year), str(lan)])
 
     if df.empty:
         fig = px.scatter(title=f"Spending per student(SEK) – {year} (no data)")
         return fig, df
 
-    df["kommun_kod"] = df["kommun_kod"].astype(str).str.zfill(4)
     df["totalt_per_elev"] = pd.to_numeric(df["totalt_per_elev"], errors="coerce")
-
-    geojson = geojson_from_geo_simplified(0.01)
+    df["lan_kod"] = df["lan_kod"].astype(str).str.zfill(2)
+
+    center, zoom = DEFAULT_CENTER, float(DEFAULT_ZOOM)
+    title = f"Spending per student(SEK) – {year}"
+    if by_lan:
+        location, name = "lan_kod", "lan"
+        geojson = geojson_url_simplified(geo_artifacts.level_for_zoom(DEFAULT_ZOOM, "lan") or 0.01, "lan")
+        title += " – per län (student-weighted)"
+    else:
+        location, name = "kommun_kod", "kommun"
+        df["kommun_kod"] = df["kommun_kod"].astype(str).str.zfill(4)
+        if is_all(lan):
+            # geometry goes to the browser once, as a cached static file,
+            # at the level of detail for the map's zoom
+            geojson = geojson_url_simplified(geo_artifacts.level_for_zoom(DEFAULT_ZOOM) or 0.01)
+        else:
+            geojson, center, zoom = geojson_url_for_lan(df["lan_kod"].iloc[0])
+            title += f" – {lan}"
 
     fig = px.choropleth_mapbox(
         df,
         geojson=geojson,
-        locations="kommun_kod",
-        featureidkey="properties.kommun_kod",
+        locations=location,
+        featureidkey=f"properties.{location}",
         color="totalt_per_elev",
-        hover_name="kommun",
+        hover_name=name,
         hover_data={
-            "kommun_kod": True,
+            location: True,
             # nicer formatting in tooltip
             "totalt_per_elev": ":,.0f",
         },
-        mapbox_style="carto-positron",
-        center=DEFAULT_CENTER,
-        zoom=float(DEFAULT_ZOOM),
+        center=center,
+        zoom=float(zoom),
         opacity=0.80,
-        title=f"Spending per student(SEK) – {year}",
+        title=title,
     )
 
     fig.update_layout(
         margin={"r": 0, "t": 55, "l": 0, "b": 0},
+        # local raster tiles when BASEMAP_TILE_URL is set (app/geo/tiles.py)
+        **basemap_layout(),
     )
+    compact_numeric_arrays(fig)
 
     return fig, df
 
 
-def build_top_bottom_budget(df_budget: pd.DataFrame, n: int) -> tuple["px.Figure", "px.Figure"]:
+def build_top_bottom_budget(
+    df_budget: pd.DataFrame, n: int, label_col: str = "kommun"
+) -> tuple["px.Figure", "px.Figure"]:
+    label = "County" if label_col == "lan" else "Municipality"
+
     if df_budget is None or df_budget.empty:
         fig_top = px.bar(title=f"Top {n} (no data)")
         fig_bot = px.bar(title=f"Bottom {n} (no data)")
@@ -251,19 +607,19 @@ def build_top_bottom_budget(df_budget: pd.DataFrame, n: int) -> tuple["px.Figure
     fig_top = px.bar(
         top.sort_values("totalt_per_elev", ascending=True),
         x="totalt_per_elev",
-        y="kommun",
+        y=label_col,
         orientation="h",
         title=f"Top {n} (highest budget per student)",
-        labels={"kommun": "Municipality", "totalt_per_elev": "SEK per student"},
+        labels={label_col: label, "totalt_per_elev": "SEK per student"},
     )
 
     fig_bot = px.bar(
         bot.sort_values("totalt_per_elev", ascending=False),
         x="totalt_per_elev",
-        y="kommun",
+        y=label_col,
         orientation="h",
         title=f"Bottom {n} (lowest budget per student)",
-        labels={"kommun": "Municipality", "totalt_per_elev": "SEK per student"},
+        labels={label_col: label, "totalt_per_elev": "SEK per student"},
     )
 
     # ---- shared styling (match other pages) ----
@@ -300,7 +656,7 @@ def build_top_bottom_budget(df_budget: pd.DataFrame, n: int) -> tuple["px.Figure
             title_standoff=20,       )
 
         fig.update_yaxes(
-            title_text="Municipality",
+            title_text=label,
             automargin=True,
             showgrid=False,
             zeroline=False,
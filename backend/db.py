@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from pathlib import Path
 import os
+import threading
 import duckdb
 import pandas as pd
 
@@ -17,16 +18,287 @@ DBT_SCHEMA = os.getenv("DBT_SCHEMA", "").strip()
 # cache برای اینکه هر بار دنبال schema نگردیم
 _TABLE_SCHEMA_CACHE: dict[str, str] = {}
 
+# In-memory mirror of the marts (optional startup mode):
+#   DUCKDB_MIRROR=1              -> serve reads from an in-memory copy of mart_* tables
+#   DUCKDB_MIRROR_MEMORY_MB=512  -> memory budget for the mirror (tables that don't fit are read
+#                                   from the file with a short-lived connection per query)
+#   DUCKDB_MIRROR_QUERY_MEMORY_MB=256 -> extra memory for running queries on top of the budget
+#   DUCKDB_MIRROR_INDEXES=1      -> build ART indexes on kommun/year columns of mirrored tables
+MIRROR_ENABLED = os.getenv("DUCKDB_MIRROR", "").strip().lower() in ("1", "true", "yes")
+MIRROR_MEMORY_MB = int(os.getenv("DUCKDB_MIRROR_MEMORY_MB", "512"))
+MIRROR_QUERY_MEMORY_MB = int(os.getenv("DUCKDB_MIRROR_QUERY_MEMORY_MB", "256"))
+MIRROR_INDEXES = os.getenv("DUCKDB_MIRROR_INDEXES", "1").strip().lower() in ("1", "true", "yes")
+MIRROR_TABLE_PREFIX = "mart_"
+MIRROR_INDEX_COLUMNS = ("kommun_kod", "kommun", "year", "lasar_start")
+
+# Query-server mode (backend/query_server.py): one process owns the DB file,
+#   QUERY_SERVER_SOCKET=duckdb.sock -> every read here goes through that server
+QUERY_SERVER_SOCKET = os.getenv("QUERY_SERVER_SOCKET", "").strip()
+
+_MIRROR_CON: duckdb.DuckDBPyConnection | None = None
+_MIRROR_GENERATION: str | None = None
+_MIRROR_OPTIONS: tuple[int, bool] | None = None  # (memory_mb, indexes) of the active mirror
+_MIRROR_TABLES: dict[str, str] = {}  # "schema.table" -> "memory" | "disk"
+_MIRROR_LOCK = threading.Lock()
+
+
+def file_generation() -> str:
+    """Cheap identifier of the DB file contents (mtime + size)."""
+    try:
+        st = DB_PATH.stat()
+    except FileNotFoundError:
+        return "missing"
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def data_generation() -> str:
+    """
+    Identifier of the data the reads currently see; used to key caches.
+    Changes whenever the pipeline rewrites the database. With a query server
+    it is the generation of the server's snapshot (the file may already be
+    newer while the pipeline is still writing).
+    """
+    if QUERY_SERVER_SOCKET:
+        from backend.query_server import client
+
+        try:
+            return client().generation()
+        except OSError:
+            pass  # server not reachable -> the file is the best guess
+    return file_generation()
+
 
 def _connect(read_only: bool = True) -> duckdb.DuckDBPyConnection:
+    if QUERY_SERVER_SOCKET and read_only:
+        from backend.query_server import connect
+
+        return connect()
     if not DB_PATH.exists():
         raise FileNotFoundError(f"DuckDB not found: {DB_PATH.resolve()}")
     return duckdb.connect(str(DB_PATH), read_only=read_only)
 
 
-def query_df(sql: str) -> pd.DataFrame:
+def _quote_ident(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+# bytes per value for the size estimate of a mart before it is copied
+# (strings and anything unlisted: a rough average)
+_TYPE_BYTES = {
+    "BOOLEAN": 1, "TINYINT": 1, "SMALLINT": 2, "INTEGER": 4, "BIGINT": 8, "HUGEINT": 16,
+    "UTINYINT": 1, "USMALLINT": 2, "UINTEGER": 4, "UBIGINT": 8,
+    "FLOAT": 4, "DOUBLE": 8, "DECIMAL": 16, "DATE": 4, "TIME": 8, "TIMESTAMP": 8,
+}
+_DEFAULT_TYPE_BYTES = 32
+
+
+def _build_mirror(budget_mb: int, build_indexes: bool) -> tuple[duckdb.DuckDBPyConnection, dict[str, str], str]:
+    """New in-memory mirror of the current DB file -> (connection, placement, generation)."""
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"DuckDB not found: {DB_PATH.resolve()}")
+
+    gen = file_generation()
+    con = duckdb.connect(":memory:")
+    # the budget is for the mirrored tables; queries get their own headroom on top.
+    # DuckDB spills to temp files instead of failing, so the limit alone never
+    # keeps a mart on disk -> the size is checked before copying (below).
+    con.execute(f"SET memory_limit = '{int(budget_mb) + MIRROR_QUERY_MEMORY_MB}MB'")
+    disk_path = str(DB_PATH.resolve()).replace("'", "''")
+    con.execute(f"ATTACH '{disk_path}' AS disk (READ_ONLY)")
+    try:
+        placement = _copy_marts(con, budget_mb, build_indexes)
+    finally:
+        # the file is only open while copying: no lock held against the pipeline
+        con.execute("DETACH disk")
+    return con, placement, gen
+
+
+def _copy_marts(con: duckdb.DuckDBPyConnection, budget_mb: int, build_indexes: bool) -> dict[str, str]:
+    """Copy the marts that fit `budget_mb` from `disk` into `memory` -> placement."""
+    tables = con.execute(
+        """
+        SELECT schema_name, table_name, estimated_size
+        FROM duckdb_tables()
+        WHERE database_name = 'disk'
+        """
+    ).fetchall()
+    views = con.execute(
+        """
+        SELECT schema_name, view_name
+        FROM duckdb_views()
+        WHERE database_name = 'disk' AND NOT internal
+        """
+    ).fetchall()
+    column_types: dict[tuple[str, str], list[str]] = {}
+    for schema, name, data_type in con.execute(
+        """
+        SELECT schema_name, table_name, data_type
+        FROM duckdb_columns()
+        WHERE database_name = 'disk'
+        """
+    ).fetchall():
+        column_types.setdefault((schema, name), []).append(data_type)
+
+    def _estimated_bytes(schema: str, name: str, rows: int) -> int:
+        types = column_types.get((schema, name), [])
+        width = sum(_TYPE_BYTES.get(t.split("(")[0], _DEFAULT_TYPE_BYTES) for t in types)
+        return int(rows or 0) * max(width, 1)
+
+    placement: dict[str, str] = {}
+
+    # smallest marts first, so as many as possible fit the budget
+    sized = sorted(
+        ((_estimated_bytes(schema, name, rows), schema, name) for schema, name, rows in tables),
+        key=lambda r: (r[0], r[1], r[2]),
+    )
+    budget_bytes = int(budget_mb) * 1024 * 1024
+    used = 0
+    for size, schema, name in sized:
+        if not name.startswith(MIRROR_TABLE_PREFIX) or used + size > budget_bytes:
+            placement[f"{schema}.{name}"] = "disk"
+            continue
+
+        con.execute(f"CREATE SCHEMA IF NOT EXISTS memory.{_quote_ident(schema)}")
+        target = f"memory.{_quote_ident(schema)}.{_quote_ident(name)}"
+        con.execute(
+            f"CREATE TABLE {target} AS "
+            f"SELECT * FROM disk.{_quote_ident(schema)}.{_quote_ident(name)}"
+        )
+        used += size
+        placement[f"{schema}.{name}"] = "memory"
+
+        if build_indexes:
+            cols = {
+                r[0]
+                for r in con.execute(
+                    """
+                    SELECT column_name
+                    FROM duckdb_columns()
+                    WHERE database_name = 'memory' AND schema_name = ? AND table_name = ?
+                    """,
+                    [schema, name],
+                ).fetchall()
+            }
+            for col in MIRROR_INDEX_COLUMNS:
+                if col not in cols:
+                    continue
+                idx = _quote_ident(f"idx_{schema}_{name}_{col}")
+                try:
+                    con.execute(f"CREATE INDEX {idx} ON {target} ({_quote_ident(col)})")
+                except duckdb.OutOfMemoryException:
+                    # index is optional; the table itself is already mirrored
+                    break
+
+    for schema, name in views:
+        placement[f"{schema}.{name}"] = "disk"
+
+    return placement
+
+
+def enable_memory_mirror(
+    memory_mb: int | None = None,
+    indexes: bool | None = None,
+) -> dict[str, str]:
+    """
+    Copy all mart_* tables into an in-memory DuckDB database and serve reads from it.
+
+    - The on-disk DB is attached read-only only while copying, then detached,
+      so the mirror holds no lock on the file.
+    - Marts are copied smallest first (by estimated size), so as many as
+      possible fit the budget.
+    - A query that reads anything else (non-mart tables, views, marts over
+      the budget, catalog queries) runs on a short-lived read-only connection
+      to the file, as without the mirror (see _mirror_serves()).
+    - The file is reopened only when file_generation() changes (see _mirror()).
+    Returns {"schema.table": "memory" | "disk"}.
+    """
+    global _MIRROR_CON, _MIRROR_GENERATION, _MIRROR_OPTIONS
+
+    with _MIRROR_LOCK:
+        if _MIRROR_CON is not None and _MIRROR_GENERATION == file_generation():
+            return dict(_MIRROR_TABLES)
+
+        budget = MIRROR_MEMORY_MB if memory_mb is None else int(memory_mb)
+        build_indexes = MIRROR_INDEXES if indexes is None else bool(indexes)
+        con, placement, gen = _build_mirror(budget, build_indexes)
+
+        # swap; queries still running on the old mirror keep their cursors
+        _MIRROR_CON = con
+        _MIRROR_GENERATION = gen
+        _MIRROR_OPTIONS = (budget, build_indexes)
+        _MIRROR_TABLES.clear()
+        _MIRROR_TABLES.update(placement)
+
+        in_mem = sum(1 for v in placement.values() if v == "memory")
+        print(f"✅ DuckDB mirror: {in_mem} mart tables in memory (budget {budget} MB)")
+        return dict(_MIRROR_TABLES)
+
+
+def disable_memory_mirror() -> None:
+    """Drop the in-memory mirror; reads go straight to disk again."""
+    global _MIRROR_CON, _MIRROR_GENERATION, _MIRROR_OPTIONS
+    with _MIRROR_LOCK:
+        if _MIRROR_CON is not None:
+            _MIRROR_CON.close()
+        _MIRROR_CON = None
+        _MIRROR_GENERATION = None
+        _MIRROR_OPTIONS = None
+        _MIRROR_TABLES.clear()
+
+
+def refresh_memory_mirror() -> dict[str, str]:
+    """Rebuild the mirror from disk (e.g. after the pipeline has written new marts)."""
+    if _MIRROR_OPTIONS is None:
+        return enable_memory_mirror()
+    return enable_memory_mirror(*_MIRROR_OPTIONS)
+
+
+def mirror_status() -> dict[str, str]:
+    """{"schema.table": "memory" | "disk"} for the active mirror ({} when disabled)."""
+    return dict(_MIRROR_TABLES)
+
+
+def _mirror() -> duckdb.DuckDBPyConnection | None:
+    # the query server keeps its own in-memory snapshot
+    if QUERY_SERVER_SOCKET:
+        return None
+    if _MIRROR_CON is None:
+        if MIRROR_ENABLED:
+            enable_memory_mirror()
+    elif _MIRROR_GENERATION != file_generation():
+        # the pipeline wrote new marts -> copy them instead of serving the old ones
+        try:
+            refresh_memory_mirror()
+        except (duckdb.Error, OSError) as e:
+            print(f"⚠️ DuckDB mirror refresh postponed: {e}")
+    return _MIRROR_CON
+
+
+def _mirror_serves(mirror: duckdb.DuckDBPyConnection, sql: str) -> bool:
+    """True when every table `sql` reads is a mart copied into the mirror."""
+    try:
+        names = mirror.get_table_names(sql, qualified=True)
+    except duckdb.Error:
+        return False
+    if not names:
+        # SHOW / PRAGMA / catalog-only queries describe the file, not the mirror
+        return False
+    placement = _MIRROR_TABLES
+    return all(
+        placement.get(name if "." in name else f"main.{name}") == "memory"
+        for name in names
+    )
+
+
+def query_df(sql: str, params: list | None = None) -> pd.DataFrame:
+    mirror = _mirror()
+    if mirror is not None and _mirror_serves(mirror, sql):
+        # one cursor per call -> safe to use from several Taipy threads
+        with mirror.cursor() as cur:
+            return cur.execute(sql, params).fetchdf()
+
     with _connect(read_only=True) as con:
-        return con.execute(sql).fetchdf()
+        return con.execute(sql, params).fetchdf()
 
 
 def show_tables() -> pd.DataFrame:
@@ -123,5 +395,14 @@ def distinct_values(table: str, col: str, limit: int = 500) -> list:
     return df["v"].tolist() if not df.empty else []
 
 
-def get_connection(read_only: bool = True) -> duckdb.DuckDBPyConnection:
+def get_connection(read_only: bool = True, sql: str | None = None) -> duckdb.DuckDBPyConnection:
+    """
+    Connection for the caller to use and close. With the mirror on and `sql`
+    given, a mirror cursor when the mirror holds every table `sql` reads;
+    otherwise a (short-lived) connection to the file.
+    """
+    if read_only and sql is not None:
+        mirror = _mirror()
+        if mirror is not None and _mirror_serves(mirror, sql):
+            return mirror.cursor()
     return _connect(read_only=read_only)
@@ -0,0 +1,177 @@
+"""
+Process-wide LRU cache of built figures.
+
+The number of distinct filter combinations is small and the same for every
+user, so figures are shared across sessions, keyed by
+(view, normalized filter tuple, data generation). The cache is bounded by an
+approximate byte budget (FIGURE_CACHE_MB, default 64) and is emptied as soon
+as the data generation changes (i.e. after a pipeline run); callbacks
+registered with on_generation_change() run at the same moment.
+
+Cached figures are shared objects: callers must treat them as read-only.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from plotly.basedatatypes import BaseFigure
+
+from backend.db import data_generation
+from backend.utils import is_all
+
+FIGURE_CACHE_MB = int(os.getenv("FIGURE_CACHE_MB", "64"))
+
+# called (without arguments) when the data generation changes, so process-wide
+# data caches elsewhere (resident mart frames, ...) are dropped together with the figures
+_GENERATION_LISTENERS: list[Callable[[], None]] = []
+
+
+def on_generation_change(callback: Callable[[], None]) -> Callable[[], None]:
+    """Register `callback` to run when the figure cache sees a new data generation."""
+    _GENERATION_LISTENERS.append(callback)
+    return callback
+
+
+def normalize_filters(*values) -> tuple:
+    """("All", None, 2023, " Skåne län ") -> ("All", "All", "2023", "Skåne län")."""
+    return tuple("All" if is_all(v) else str(v).strip() for v in values)
+
+
+# trace properties that hold the per-point data of the dashboard's figures
+_TRACE_ARRAYS = (
+    "x", "y", "z", "lat", "lon", "locations", "values", "labels", "ids",
+    "text", "hovertext", "customdata",
+)
+
+
+def _array_bytes(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return 8 * len(value)
+    return 8
+
+
+def _trace_bytes(trace) -> int:
+    """Bytes of a trace's data arrays (read through the public properties, no copy)."""
+    size = sum(_array_bytes(getattr(trace, name, None)) for name in _TRACE_ARRAYS)
+    marker = getattr(trace, "marker", None)
+    if marker is not None:
+        size += _array_bytes(getattr(marker, "color", None)) + _array_bytes(getattr(marker, "size", None))
+    return size
+
+
+def _estimate_size(value) -> int:
+    """Approximate in-memory size of a cached value in bytes."""
+    if value is None:
+        return 0
+    if isinstance(value, (tuple, list)):
+        return sum(_estimate_size(v) for v in value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, BaseFigure):
+        # plotly figures: the trace arrays dominate; the layout is a few KB
+        return sum(_trace_bytes(trace) for trace in value.data) + 4096
+    return 1024
+
+
+class FigureCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._entries: OrderedDict[tuple, tuple[object, int]] = OrderedDict()
+        self._bytes = 0
+        self._generation: str | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _sync_generation(self) -> str:
+        """
+        Current data generation; empties the cache when it changed. The
+        generation is read and the listeners run outside the lock, so a slow
+        stat/query-server call or a listener never blocks other sessions.
+        """
+        gen = data_generation()
+        with self._lock:
+            if gen == self._generation:
+                return gen
+            notify = self._generation is not None
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = gen
+        if notify:
+            for callback in _GENERATION_LISTENERS:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"⚠️ generation change callback {callback.__name__} failed: {e}")
+        return gen
+
+    def get(self, view: str, key: tuple):
+        """Cached value or None (counts as hit/miss)."""
+        gen = self._sync_generation()
+        with self._lock:
+            entry = self._entries.get((view, key, gen))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((view, key, gen))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, view: str, key: tuple, value) -> None:
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        gen = self._sync_generation()
+        with self._lock:
+            if gen != self._generation:
+                return  # built from data that has been replaced meanwhile
+            full_key = (view, key, gen)
+            old = self._entries.pop(full_key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[full_key] = (value, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _k, (_v, s) = self._entries.popitem(last=False)
+                self._bytes -= s
+
+    def get_or_build(self, view: str, key: tuple, builder: Callable[[], object]):
+        """Return the cached value for (view, key) or build, store and return it."""
+        value = self.get(view, key)
+        if value is None:
+            value = builder()
+            self.put(view, key, value)
+        return value
+
+    def invalidate(self) -> None:
+        """Drop everything (e.g. after a data refresh)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "generation": self._generation,
+            }
+
+
+figure_cache = FigureCache(FIGURE_CACHE_MB * 1024 * 1024)
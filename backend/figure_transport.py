@@ -0,0 +1,101 @@
+"""
+Smaller figure payloads for the browser.
+
+- Geometry: the kommun GeoJSON is written once to a static file with a content
+  hash in its name and the choropleth only references its URL, so the browser
+  downloads (and caches) the polygons once instead of receiving them inside
+  every figure update.
+- Numbers: numeric trace arrays are stored as compact NumPy arrays; plotly (>= 6)
+  serializes NumPy arrays as typed binary buffers ({"dtype", "bdata"}) instead
+  of JSON number lists.
+- Compression: app/main.py enables gzip for HTTP responses when flask-compress
+  is installed.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+
+import numpy as np
+
+from config import BASE_DIR
+
+# served by Taipy through Gui(path_mapping={GEO_URL_PREFIX: GEO_STATIC_DIR})
+GEO_STATIC_DIR = BASE_DIR / "assets" / "geo"
+GEO_URL_PREFIX = "geo"
+
+NUMERIC_TRACE_ATTRS = ("x", "y", "z", "customdata")
+
+_PUBLISHED: dict[str, str] = {}
+_PUBLISH_LOCK = threading.Lock()
+
+
+def _publish_bytes(name: str, payload: bytes) -> str:
+    digest = hashlib.sha1(payload).hexdigest()[:12]
+    file_name = f"{name}-{digest}.geojson"
+
+    with _PUBLISH_LOCK:
+        url = _PUBLISHED.get(file_name)
+        if url is not None:
+            return url
+
+        GEO_STATIC_DIR.mkdir(parents=True, exist_ok=True)
+        path = GEO_STATIC_DIR / file_name
+        if not path.exists():
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(payload)
+            tmp.replace(path)
+
+        url = f"/{GEO_URL_PREFIX}/{file_name}"
+        _PUBLISHED[file_name] = url
+        return url
+
+
+def publish_geojson(name: str, geojson: dict) -> str:
+    """
+    Write `geojson` to the static geo dir (once per content) and return its URL.
+    The file name contains a content hash, so browsers can cache it for good.
+    """
+    return _publish_bytes(name, json.dumps(geojson, separators=(",", ":")).encode("utf-8"))
+
+
+def publish_geojson_file(name: str, path) -> str:
+    """Like publish_geojson(), for a GeoJSON file that already exists on disk."""
+    with open(path, "rb") as f:
+        return _publish_bytes(name, f.read())
+
+
+def _compact_array(values):
+    """Numeric sequence -> float32/int32 NumPy array; anything else unchanged."""
+    if values is None or isinstance(values, (str, bytes, dict)):
+        return values
+    try:
+        arr = np.asarray(values)
+    except Exception:
+        return values
+    if arr.ndim == 0 or arr.dtype.kind not in "iuf":
+        return values
+    if arr.dtype.kind == "f":
+        return arr.astype(np.float32, copy=False)
+    if arr.size and (arr.min() < np.iinfo(np.int32).min or arr.max() > np.iinfo(np.int32).max):
+        return arr
+    return arr.astype(np.int32, copy=False)
+
+
+def compact_numeric_arrays(fig):
+    """Store numeric trace arrays (x/y/z/customdata) as compact NumPy arrays, in place."""
+    for trace in fig.data:
+        for attr in NUMERIC_TRACE_ATTRS:
+            if attr not in trace:
+                continue
+            current = trace[attr]
+            compact = _compact_array(current)
+            if compact is not current:
+                trace[attr] = compact
+    return fig
+
+
+def payload_size(fig) -> int:
+    """Size in bytes of the figure as it is sent to the browser."""
+    return len(fig.to_json()) if fig is not None else 0
@@ -0,0 +1,95 @@
+"""
+Row-position index over a resident mart frame.
+
+Built once per mart: for every indexed column, each distinct value maps to a
+sorted array of row positions. A filter combination is resolved by
+intersecting those arrays (smallest first) and gathering the rows with
+DataFrame.take(), so a callback costs O(matching rows) instead of one full
+boolean scan per filter.
+
+The index belongs to the pandas path: DASHBOARD_PUSHDOWN=0, e.g. the workers
+of app/serve.py and app/reports.py on the Arrow mart store. With pushdown on
+(the default) the callbacks query DuckDB (backend/queries.py) and no mart
+frame or index is built.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from backend.utils import is_all
+
+INDEX_COLUMNS = ("year", "lan", "kommun", "huvudman_typ", "subject")
+
+
+class MartIndex:
+    def __init__(self, df: pd.DataFrame, columns: tuple[str, ...] = INDEX_COLUMNS):
+        self.df = df
+        self._positions: dict[str, dict[object, np.ndarray]] = {}
+
+        for col in columns:
+            if col not in df.columns:
+                continue
+
+            codes, uniques = pd.factorize(df[col])
+            codes = np.asarray(codes)
+
+            # stable sort keeps positions ascending inside every value group;
+            # NaN rows (code -1) end up first and are skipped
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            start = int((codes < 0).sum())
+
+            groups: dict[object, np.ndarray] = {}
+            for i, n in enumerate(counts):
+                groups[uniques[i]] = order[start:start + n]
+                start += n
+            self._positions[col] = groups
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._positions)
+
+    def values(self, col: str) -> list:
+        """Distinct non-null values of an indexed column."""
+        return list(self._positions.get(col, {}))
+
+    def positions(self, col: str, value) -> np.ndarray:
+        """Sorted row positions where `col` equals `value` (or any of a list of values)."""
+        if isinstance(value, (list, tuple, set, frozenset)):
+            parts = [self.positions(col, v) for v in value]
+            if not parts:
+                return np.empty(0, dtype=np.intp)
+            return np.unique(np.concatenate(parts))
+
+        groups = self._positions.get(col)
+        if groups is None:
+            # not indexed -> plain scan
+            return np.flatnonzero((self.df[col] == value).to_numpy())
+
+        return groups.get(value, np.empty(0, dtype=np.intp))
+
+    def select_positions(self, **filters) -> np.ndarray | None:
+        """Row positions matching all filters; None when no filter applies."""
+        arrays = [
+            self.positions(col, value)
+            for col, value in filters.items()
+            if not is_all(value)
+        ]
+        if not arrays:
+            return None
+
+        arrays.sort(key=len)
+        pos = arrays[0]
+        for other in arrays[1:]:
+            if len(pos) == 0:
+                break
+            pos = np.intersect1d(pos, other, assume_unique=True)
+        return pos
+
+    def select(self, **filters) -> pd.DataFrame:
+        """Rows matching all filters, e.g. select(lan="Skåne län", year=2023)."""
+        pos = self.select_positions(**filters)
+        if pos is None:
+            return self.df
+        return self.df.take(pos)
@@ -0,0 +1,158 @@
+"""
+Precomputed map geometry written by app/geo/preprocess_geo.py.
+
+The preprocessing step crops and simplifies the kommun/län layers at a few
+fixed tolerances and records them in app/geo/processed/manifest.json. The
+dashboard only reads those files: each level is parsed once and kept in memory,
+so building a map never touches geopandas. (The drill-down crop tests the
+kommun polygons with a shapely STRtree, app/geo/locator.py.)
+
+Levels are stored as TopoJSON (shared arcs, quantized) and as GeoJSON decoded
+from it, which is what plotly/the browser needs. The GeoJSON is read when
+present (json's C parser beats decoding arcs in Python); the TopoJSON is
+decoded with app/geo/topology.py otherwise.
+
+The manifest's "lod" table maps a map zoom to a level (app/geo/lod.py):
+coarse geometry for the whole country when zoomed out, fine geometry cropped
+to the visible area when zoomed in.
+
+    python -m app.geo.preprocess_geo      # (re)build the artifacts
+"""
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+
+from app.geo import lod
+from app.geo.locator import KommunLocator
+from app.geo.topology import topojson_to_geojson
+from config import BASE_DIR
+
+GEO_PROCESSED_DIR = BASE_DIR / "app" / "geo" / "processed"
+MANIFEST_FILE = GEO_PROCESSED_DIR / "manifest.json"
+
+_MANIFEST: dict | None = None
+_GEOJSON: dict[Path, dict] = {}
+_VIEWS: dict[tuple, dict] = {}
+_LOCATORS: dict[tuple, KommunLocator] = {}
+_LOCK = threading.Lock()
+
+
+def manifest() -> dict:
+    global _MANIFEST
+    if _MANIFEST is None:
+        if MANIFEST_FILE.exists():
+            _MANIFEST = json.loads(MANIFEST_FILE.read_text(encoding="utf-8"))
+        else:
+            _MANIFEST = {}
+    return _MANIFEST
+
+
+def levels(layer: str = "kommuner") -> list[float]:
+    """Simplification tolerances available for `layer` (ascending)."""
+    return sorted(float(t) for t in manifest().get("geojson", {}).get(layer, {}))
+
+
+def nearest_level(tolerance: float, layer: str = "kommuner") -> float | None:
+    available = levels(layer)
+    if not available:
+        return None
+    return min(available, key=lambda t: abs(t - float(tolerance)))
+
+
+def _artifact_path(kind: str, layer: str, tolerance: float) -> Path | None:
+    tol = nearest_level(tolerance, layer)
+    if tol is None:
+        return None
+    name = manifest().get(kind, {}).get(layer, {}).get(f"{tol:g}")
+    if name is None:
+        return None
+    path = GEO_PROCESSED_DIR / name
+    return path if path.exists() else None
+
+
+def geojson_path(layer: str = "kommuner", tolerance: float = 0.01) -> Path | None:
+    """GeoJSON artifact for the level closest to `tolerance` (None if not built)."""
+    return _artifact_path("geojson", layer, tolerance)
+
+
+def topojson_path(layer: str = "kommuner", tolerance: float = 0.01) -> Path | None:
+    """TopoJSON artifact for the level closest to `tolerance` (None if not built)."""
+    return _artifact_path("topojson", layer, tolerance)
+
+
+def load_geojson(layer: str = "kommuner", tolerance: float = 0.01) -> dict | None:
+    """Parsed GeoJSON for the level closest to `tolerance`, cached for the process."""
+    path = geojson_path(layer, tolerance)
+    is_topo = path is None
+    if is_topo:
+        path = topojson_path(layer, tolerance)
+    if path is None:
+        return None
+    cached = _GEOJSON.get(path)
+    if cached is None:
+        with _LOCK:
+            cached = _GEOJSON.get(path)
+            if cached is None:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                cached = topojson_to_geojson(data, layer) if is_topo else data
+                _GEOJSON[path] = cached
+    return cached
+
+
+def level_for_zoom(zoom: float, layer: str = "kommuner") -> float | None:
+    """Tolerance to draw `layer` with at map zoom `zoom` (None if not built)."""
+    pyramid = manifest().get("lod", {}).get(layer)
+    if pyramid:
+        z = min(max(int(zoom), lod.MIN_ZOOM), lod.MAX_ZOOM)
+        return float(pyramid[str(z)])
+    available = levels(layer)
+    return lod.tolerance_for_zoom(zoom, available) if available else None
+
+
+def _locator(tolerance: float) -> KommunLocator:
+    """STRtree over the kommun polygons of one level, built once per process."""
+    key = ("kommuner", tolerance)
+    loc = _LOCATORS.get(key)
+    if loc is None:
+        loc = KommunLocator.from_geojson(load_geojson("kommuner", tolerance))
+        with _LOCK:
+            _LOCATORS[key] = loc
+    return loc
+
+
+def geojson_for_view(layer: str, zoom: float, bbox=None) -> dict | None:
+    """
+    GeoJSON for a map view: the level for `zoom`, limited to the features that
+    intersect `bbox` (lon_min, lat_min, lon_max, lat_max) when given.
+    """
+    tol = level_for_zoom(zoom, layer)
+    if tol is None:
+        return None
+    full = load_geojson(layer, tol)
+    if bbox is None:
+        return full
+
+    key = (layer, tol, tuple(round(float(v), 2) for v in bbox))
+    view = _VIEWS.get(key)
+    if view is None:
+        if layer == "kommuner":
+            view = _locator(tol).crop(full, bbox)
+        else:
+            view = lod.crop_features(full, bbox)
+        with _LOCK:
+            _VIEWS[key] = view
+    return view
+
+
+def feature_bbox(layer: str, key: str, value: str) -> list[float] | None:
+    """bbox of the feature of `layer` whose property `key` equals `value` (coarsest level)."""
+    available = levels(layer)
+    if not available:
+        return None
+    geojson = load_geojson(layer, available[-1])
+    for feature in geojson["features"]:
+        if str(feature["properties"].get(key)) == str(value):
+            return feature.get("bbox") or lod.geometry_bbox(feature.get("geometry"))
+    return None
@@ -0,0 +1,163 @@
+"""
+Arrow IPC mart store shared by several dashboard worker processes.
+
+A loader process writes every mart (already compacted, see MART_SCHEMAS) and
+the precomputed kommun GeoJSON once into MART_STORE_DIR/<generation>/. Workers
+started with MART_STORE_DIR set memory-map those files read-only instead of
+querying DuckDB, so the OS page cache holds one copy of the data no matter
+how many workers run.
+
+    python -m backend.mart_store            # export (loader)
+    MART_STORE_DIR=mart_store python -m app.main   # worker
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from backend.db import data_generation
+from config import BASE_DIR
+
+MART_STORE_DIR = os.getenv("MART_STORE_DIR", "").strip()
+STORE_ENABLED = bool(MART_STORE_DIR)
+
+DEFAULT_STORE_DIR = BASE_DIR / "mart_store"
+CURRENT_FILE = "CURRENT"
+GEOJSON_TOLERANCE = 0.01
+
+_TABLE_CACHE: dict[str, pa.Table] = {}
+
+
+def _root(store_dir: str | Path | None = None) -> Path:
+    if store_dir:
+        return Path(store_dir)
+    return Path(MART_STORE_DIR) if MART_STORE_DIR else DEFAULT_STORE_DIR
+
+
+def current_dir(store_dir: str | Path | None = None) -> Path | None:
+    """Directory of the active store generation (None if nothing is exported)."""
+    root = _root(store_dir)
+    pointer = root / CURRENT_FILE
+    if not pointer.exists():
+        return None
+    d = root / pointer.read_text(encoding="utf-8").strip()
+    return d if d.is_dir() else None
+
+
+def export_store(store_dir: str | Path | None = None, keep: int = 2) -> Path:
+    """
+    Write all marts + the simplified kommun GeoJSON for the current data
+    generation and switch CURRENT to it. Older generations beyond `keep` are
+    removed (workers still mapping them keep their open files).
+    """
+    # imported here: data_processing itself reads from the store when enabled
+    from backend.data_processing import (
+        DEFAULT_ZOOM,
+        MART_SCHEMAS,
+        compact_frame,
+        geojson_from_geo_simplified,
+    )
+    from backend.geo_artifacts import level_for_zoom
+    from backend.db import load_table
+
+    root = _root(store_dir)
+    gen = data_generation()
+    out = root / gen
+    tmp = root / f".{gen}.tmp"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    tables = {}
+    for table, schema in MART_SCHEMAS.items():
+        df = compact_frame(load_table(table), schema)
+        # uncompressed IPC file -> buffers can be memory-mapped as they are
+        with pa.OSFile(str(tmp / f"{table}.arrow"), "wb") as sink:
+            arrow = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.ipc.new_file(sink, arrow.schema) as writer:
+                writer.write_table(arrow)
+        tables[table] = len(df)
+
+    # the level the budget map draws at its default zoom
+    tol = level_for_zoom(DEFAULT_ZOOM) or GEOJSON_TOLERANCE
+    geojson = geojson_from_geo_simplified(tol)
+    (tmp / f"kommuner_{tol:g}.geojson").write_text(
+        json.dumps(geojson, separators=(",", ":")), encoding="utf-8"
+    )
+
+    (tmp / "manifest.json").write_text(
+        json.dumps({"generation": gen, "tables": tables}, indent=2), encoding="utf-8"
+    )
+
+    if out.exists():
+        shutil.rmtree(out)
+    tmp.rename(out)
+    (root / CURRENT_FILE).write_text(gen, encoding="utf-8")
+
+    gens = sorted(
+        (d for d in root.iterdir() if d.is_dir() and not d.name.startswith(".")),
+        key=lambda d: d.stat().st_mtime,
+        reverse=True,
+    )
+    for old in gens[keep:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+    print(f"✅ mart store: {len(tables)} marts -> {out}")
+    return out
+
+
+def read_arrow(table: str) -> pa.Table | None:
+    """
+    Memory-mapped Arrow table for `table` from the active generation.
+    None if missing, or if the export is older than the database (the pipeline
+    ran but export_store() hasn't yet) -> the caller reads DuckDB instead.
+    """
+    d = current_dir()
+    if d is None or d.name != data_generation():
+        return None
+    path = d / f"{table}.arrow"
+    if not path.exists():
+        return None
+
+    key = str(path)
+    cached = _TABLE_CACHE.get(key)
+    if cached is None:
+        source = pa.memory_map(key, "r")
+        cached = pa.ipc.open_file(source).read_all()
+        _TABLE_CACHE[key] = cached
+    return cached
+
+
+def release_tables() -> None:
+    """Forget the mapped tables; the next read maps the files of the active generation."""
+    _TABLE_CACHE.clear()
+
+
+def read_table(table: str) -> pd.DataFrame | None:
+    """
+    Mart as a DataFrame backed by the memory-mapped file.
+    split_blocks=True lets numeric columns without nulls stay zero-copy;
+    categoricals only copy their (small) codes and dictionaries.
+    """
+    arrow = read_arrow(table)
+    if arrow is None:
+        return None
+    return arrow.to_pandas(split_blocks=True)
+
+
+def geojson_path(tolerance: float = GEOJSON_TOLERANCE) -> Path | None:
+    """Precomputed kommun GeoJSON of the active generation (None if missing)."""
+    d = current_dir()
+    if d is None:
+        return None
+    path = d / f"kommuner_{float(tolerance):g}.geojson"
+    return path if path.exists() else None
+
+
+if __name__ == "__main__":
+    export_store()
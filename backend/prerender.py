@@ -0,0 +1,217 @@
+"""
+Figures pre-rendered at the end of the pipeline.
+
+The last stage of data_extract_load/load_csv_data.run_pipeline() builds the
+default view of every page plus the most used filter variations (one filter
+changed from the default: each län, year, subject, ...) and writes them as
+plotly JSON into PRERENDER_DIR/<generation>/, like backend/mart_store.py does
+for the marts. Workers load the directory of the current data generation into
+the shared figure cache at startup, so the first request after a deploy is
+served like a warm one.
+
+    python -m backend.prerender          # render for the current database
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import plotly.io as pio
+from plotly.basedatatypes import BaseFigure
+
+from backend.db import data_generation
+from backend.figure_cache import figure_cache, normalize_filters
+from config import BASE_DIR
+
+PRERENDER_DIR = Path(os.getenv("PRERENDER_DIR", "").strip() or BASE_DIR / "prerendered")
+CURRENT_FILE = "CURRENT"
+# bump when the stored format or the figure builders change incompatibly
+FORMAT_VERSION = 1
+# max values per varied filter (LOVs are short; this only bounds pathological ones)
+MAX_VALUES_PER_FILTER = int(os.getenv("PRERENDER_MAX_VALUES", "40"))
+
+
+# ---------------- encoding ----------------
+
+def _encode(value):
+    if value is None:
+        return {"t": "none"}
+    if isinstance(value, BaseFigure):
+        return {"t": "figure", "v": json.loads(pio.to_json(value, validate=False))}
+    if isinstance(value, pd.DataFrame):
+        return {"t": "frame", "v": json.loads(value.to_json(orient="split", index=False))}
+    if isinstance(value, tuple):
+        return {"t": "tuple", "v": [_encode(v) for v in value]}
+    raise TypeError(f"Cannot pre-render value of type {type(value).__name__}")
+
+
+def _decode(data):
+    t = data["t"]
+    if t == "none":
+        return None
+    if t == "figure":
+        return pio.from_json(json.dumps(data["v"]), skip_invalid=True)
+    if t == "frame":
+        v = data["v"]
+        return pd.DataFrame(v["data"], columns=v["columns"])
+    if t == "tuple":
+        return tuple(_decode(v) for v in data["v"])
+    raise ValueError(f"Unknown pre-rendered value type: {t}")
+
+
+# ---------------- which views ----------------
+
+def _values(lov: list) -> list:
+    return [v for v in lov if str(v).strip().lower() != "all"][:MAX_VALUES_PER_FILTER]
+
+
+def _variations(default: tuple, lovs: dict[int, list]) -> list[tuple]:
+    """`default` plus every combination that changes exactly one filter position."""
+    combos = [default]
+    for pos, lov in lovs.items():
+        for v in _values(lov):
+            combo = list(default)
+            combo[pos] = v
+            combos.append(tuple(combo))
+    return combos
+
+
+def view_plan() -> list[tuple[str, tuple, object]]:
+    """(view, cache key, builder) for every figure rendered by the pipeline stage."""
+    # imported here: these modules read the marts on import
+    from backend import data_processing as dp
+    from backend import updates as up
+
+    plan = []
+    for f in _variations(up.DEFAULT_TREND_FILTERS, {0: dp.lan_list, 2: dp.huvudman_list, 3: dp.subject_list}):
+        plan.append(("trend", normalize_filters(*f), lambda f=f: up.build_trend_figure(*f)))
+    for f in _variations(
+        up.DEFAULT_FAIRNESS_FILTERS, {0: dp.years, 1: dp.lan_list, 2: dp.huvudman_list, 3: dp.subject_list}
+    ):
+        plan.append(("fairness", normalize_filters(*f), lambda f=f: up.build_fairness_figure(*f)))
+    for f in _variations(up.DEFAULT_PARENT_CHOICE_FILTERS, {0: dp.parent_choice_years, 1: dp.lan_list}):
+        plan.append(("parent_choice", normalize_filters(*f), lambda f=f: up.build_parent_choice_figures(*f)))
+    plan.append(("behorighet_gender", ("2024/25",), lambda: up.build_behorighet_gender_figure("2024/25")))
+    for f in [("Län", "All")] + _variations(up.DEFAULT_KARTA_FILTERS, {1: dp.karta_lan_list}):
+        key = up.karta_cache_key(*f)
+        plan.append(("karta", key, lambda key=key: up.build_karta_figures(*key)))
+    return plan
+
+
+# ---------------- write / load ----------------
+
+def _entry_file(view: str, key: tuple) -> str:
+    digest = hashlib.sha1(json.dumps([view, list(key)]).encode("utf-8")).hexdigest()[:16]
+    return f"{view}-{digest}.json"
+
+
+def current_dir(root: Path = PRERENDER_DIR) -> Path | None:
+    """Directory of the latest complete render (None if nothing is rendered)."""
+    pointer = root / CURRENT_FILE
+    if not pointer.exists():
+        return None
+    d = root / pointer.read_text(encoding="utf-8").strip()
+    return d if d.is_dir() else None
+
+
+def prerender(root: Path = PRERENDER_DIR, keep: int = 2) -> Path:
+    """
+    Render view_plan() for the current data generation into root/<generation>/
+    and switch CURRENT to it. Views that fail to build are logged and skipped.
+    """
+    gen = data_generation()
+    out = root / gen
+    tmp = root / f".{gen}.tmp"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    t0 = time.perf_counter()
+    entries = []
+    for view, key, builder in view_plan():
+        try:
+            value = builder()
+        except Exception as e:
+            print(f"⚠️ prerender {view} {key} failed: {e}")
+            continue
+        name = _entry_file(view, key)
+        (tmp / name).write_text(
+            json.dumps({"view": view, "key": list(key), "value": _encode(value)}, separators=(",", ":")),
+            encoding="utf-8",
+        )
+        entries.append({"view": view, "key": list(key), "file": name})
+
+    (tmp / "manifest.json").write_text(
+        json.dumps(
+            {"generation": gen, "format": FORMAT_VERSION, "created": time.time(), "entries": entries},
+            indent=2,
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+
+    if out.exists():
+        shutil.rmtree(out)
+    tmp.rename(out)
+    (root / CURRENT_FILE).write_text(gen, encoding="utf-8")
+
+    gens = sorted(
+        (d for d in root.iterdir() if d.is_dir() and not d.name.startswith(".")),
+        key=lambda d: d.stat().st_mtime,
+        reverse=True,
+    )
+    for old in gens[keep:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+    print(f"✅ prerendered {len(entries)} views in {time.perf_counter() - t0:.1f}s -> {out}")
+    return out
+
+
+def load_prerendered(root: Path = PRERENDER_DIR) -> int:
+    """
+    Put the pre-rendered figures into the figure cache. Only a render of the
+    current data generation and format is used. Returns the number loaded.
+    """
+    d = current_dir(root)
+    if d is None:
+        return 0
+    manifest = json.loads((d / "manifest.json").read_text(encoding="utf-8"))
+    if manifest.get("generation") != data_generation() or manifest.get("format") != FORMAT_VERSION:
+        return 0
+
+    loaded = 0
+    for entry in manifest["entries"]:
+        try:
+            data = json.loads((d / entry["file"]).read_text(encoding="utf-8"))
+            figure_cache.put(entry["view"], tuple(entry["key"]), _decode(data["value"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ prerendered {entry.get('file')} skipped: {e}")
+            continue
+        loaded += 1
+    return loaded
+
+
+def load_prerendered_in_background(root: Path = PRERENDER_DIR) -> threading.Thread:
+    """load_prerendered() in a daemon thread (decoding takes a few seconds)."""
+    def _run() -> None:
+        try:
+            n = load_prerendered(root)
+        except Exception as e:
+            print(f"⚠️ loading prerendered figures failed: {e}")
+            return
+        if n:
+            print(f"✅ {n} prerendered views loaded into the figure cache")
+
+    t = threading.Thread(target=_run, name="prerender-load", daemon=True)
+    t.start()
+    return t
+
+
+if __name__ == "__main__":
+    prerender()
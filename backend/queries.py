@@ -0,0 +1,151 @@
+"""
+Parameterized DuckDB queries for the dashboard views.
+
+Filters and aggregation run inside DuckDB, so a callback only gets back the
+rows that are actually plotted (instead of copying and masking a whole mart
+in pandas).
+
+DASHBOARD_PUSHDOWN=0 switches the callbacks back to the in-memory pandas path.
+"""
+from __future__ import annotations
+
+import os
+
+import pandas as pd
+
+from backend.db import qualify_table, query_df
+from backend.utils import is_all
+from backend.data_processing import TREND_TABLE, CHOICE_TABLE, FAIR_TABLE
+
+PUSHDOWN_ENABLED = os.getenv("DASHBOARD_PUSHDOWN", "1").strip().lower() not in ("0", "false", "no")
+
+PARENT_CHOICE_TYPES = ("Kommunal", "Enskild")
+
+
+def build_where(filters: dict[str, object]) -> tuple[str, list]:
+    """
+    {"lan": "Skåne län", "year": "All", ...} -> ("lan = ?", ["Skåne län"]).
+    "All"/None/empty values are skipped. Column names come from our own code,
+    values are always passed as parameters.
+    """
+    clauses: list[str] = []
+    params: list = []
+    for col, value in filters.items():
+        if is_all(value):
+            continue
+        clauses.append(f"{col} = ?")
+        params.append(value)
+    return (" AND ".join(clauses) or "TRUE"), params
+
+
+def distinct_values(table: str, col: str, filters: dict[str, object]) -> list:
+    """Sorted distinct non-null values of `col` for the rows matching `filters` (LOVs)."""
+    where, params = build_where(filters)
+    sql = f"""
+        SELECT DISTINCT {col} AS v
+        FROM {qualify_table(table)}
+        WHERE {where}
+          AND {col} IS NOT NULL
+        ORDER BY 1
+    """
+    return query_df(sql, params)["v"].tolist()
+
+
+# ---------------- TREND ----------------
+
+def trend_series(lan, kommun, huvudman, subject, color: str) -> pd.DataFrame:
+    """
+    Mean score per (year, color) for the trend chart.
+    All years except the latest one in the selection (same rule as the chart).
+    """
+    where, params = build_where({
+        "lan": lan,
+        "kommun": kommun,
+        "huvudman_typ": huvudman,
+        "subject": subject,
+    })
+    sql = f"""
+        WITH filtered AS (
+            SELECT year, {color} AS grp, score
+            FROM {qualify_table(TREND_TABLE)}
+            WHERE {where}
+              AND score IS NOT NULL
+              AND year IS NOT NULL
+        )
+        SELECT year, grp AS {color}, avg(score) AS score
+        FROM filtered
+        WHERE grp IS NOT NULL
+          AND year < (SELECT max(year) FROM filtered)
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """
+    return query_df(sql, params)
+
+
+# ---------------- FAIRNESS ----------------
+
+def fairness_top_gap(year, lan, huvudman, subject, top_n: int) -> pd.DataFrame:
+    """Kommuner with the largest |girls - boys| gap in average grade points."""
+    where, params = build_where({
+        "year": year,
+        "lan": lan,
+        "huvudman_typ": huvudman,
+        "subject": subject,
+    })
+    sql = f"""
+        SELECT
+            kommun,
+            avg(betygpoang_flickor) AS betygpoang_flickor,
+            avg(betygpoang_pojkar) AS betygpoang_pojkar,
+            abs(avg(betygpoang_flickor) - avg(betygpoang_pojkar)) AS gap_abs
+        FROM {qualify_table(FAIR_TABLE)}
+        WHERE {where}
+          AND kommun IS NOT NULL
+        GROUP BY kommun
+        ORDER BY gap_abs DESC NULLS LAST, kommun
+        LIMIT ?
+    """
+    return query_df(sql, params + [int(top_n)])
+
+
+# ---------------- PARENT CHOICE ----------------
+
+def _choice_where(year, lan) -> tuple[str, list]:
+    where, params = build_where({"year": year, "lan": lan})
+    types = ", ".join("?" for _ in PARENT_CHOICE_TYPES)
+    where += f" AND huvudman_typ IN ({types}) AND n_students IS NOT NULL"
+    return where, params + list(PARENT_CHOICE_TYPES)
+
+
+def parent_choice_counts(lan) -> pd.DataFrame:
+    """
+    Student counts per (year, kommun) in one pass, shared by both parent-choice
+    charts. Columns: year, kommun, Enskild, Kommunal, total, share (Enskild share).
+    """
+    where, params = _choice_where(None, lan)
+    sql = f"""
+        WITH g AS (
+            SELECT
+                year,
+                kommun,
+                coalesce(sum(n_students) FILTER (WHERE huvudman_typ = 'Enskild'), 0) AS "Enskild",
+                coalesce(sum(n_students) FILTER (WHERE huvudman_typ = 'Kommunal'), 0) AS "Kommunal"
+            FROM {qualify_table(CHOICE_TABLE)}
+            WHERE {where}
+              AND kommun IS NOT NULL
+            GROUP BY year, kommun
+        )
+        SELECT
+            year,
+            kommun,
+            "Enskild",
+            "Kommunal",
+            "Enskild" + "Kommunal" AS total,
+            CASE
+                WHEN "Enskild" + "Kommunal" > 0 THEN "Enskild" / ("Enskild" + "Kommunal")
+                ELSE 0.0
+            END AS share
+        FROM g
+        ORDER BY year, kommun
+    """
+    return query_df(sql, params)
@@ -0,0 +1,412 @@
+"""
+Single process that owns csv_ingestion_pipeline.duckdb.
+
+DuckDB lets one process write a database file, and only while no other
+process has it open. With the Taipy workers, the Streamlit map, the API and
+the dlt/dbt pipeline all opening the file themselves, refreshes and
+dashboards block each other. In query-server mode:
+
+- the server copies the database into an in-memory snapshot and closes the
+  file again, then answers SQL from that snapshot over a Unix socket, with
+  results sent as Arrow IPC;
+- readers (backend/db.py, app/app_karta.py) set QUERY_SERVER_SOCKET and become
+  thin clients, so only the server ever holds the file open, and it holds it
+  only while it loads a snapshot;
+- the pipeline takes a write lease (write_lease()). While the lease is held,
+  readers keep getting the old snapshot. Releasing it loads the new data and
+  swaps the snapshot before returning.
+
+    python -m backend.query_server                      # owns the DB
+    QUERY_SERVER_SOCKET=duckdb.sock python -m app.main  # clients
+    QUERY_SERVER_SOCKET=duckdb.sock python -m data_extract_load.load_csv_data
+
+Wire format: 4-byte big-endian length + payload frames. A request is one JSON
+frame; the reply is a JSON frame ({"ok": ...}) followed, for queries, by one
+Arrow IPC stream frame.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import fnmatch
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+from backend.db import DB_PATH, _quote_ident, file_generation
+from config import BASE_DIR
+
+DEFAULT_SOCKET = BASE_DIR / "duckdb.sock"
+QUERY_SERVER_SOCKET = os.getenv("QUERY_SERVER_SOCKET", "").strip()
+# tables not copied into the snapshot (fnmatch patterns on the table name)
+SNAPSHOT_EXCLUDE = [
+    p.strip() for p in os.getenv("QUERY_SERVER_EXCLUDE", "_dlt_*,raw_data").split(",") if p.strip()
+]
+# reload when the file changed without a write lease (e.g. a manual dbt run)
+POLL_S = float(os.getenv("QUERY_SERVER_POLL_S", "5"))
+
+_HEADER = struct.Struct(">I")
+
+
+# ---------------- framing ----------------
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("query server connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (n,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _recv_exact(sock, n)
+
+
+def _send_json(sock: socket.socket, obj: dict) -> None:
+    _send_frame(sock, json.dumps(obj, default=str).encode("utf-8"))
+
+
+def _recv_json(sock: socket.socket) -> dict:
+    return json.loads(_recv_frame(sock))
+
+
+def _to_ipc(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# ---------------- server ----------------
+
+class Snapshot:
+    """In-memory copy of the database file (all schemas, views materialized)."""
+
+    def __init__(self):
+        gen = file_generation()
+        con = duckdb.connect(":memory:")
+        disk_path = str(DB_PATH.resolve()).replace("'", "''")
+        con.execute(f"ATTACH '{disk_path}' AS disk (READ_ONLY)")
+        try:
+            objects = con.execute(
+                """
+                SELECT schema_name, table_name FROM duckdb_tables() WHERE database_name = 'disk'
+                UNION ALL
+                SELECT schema_name, view_name FROM duckdb_views() WHERE database_name = 'disk' AND NOT internal
+                ORDER BY 1, 2
+                """
+            ).fetchall()
+            tables = []
+            for schema, name in objects:
+                if any(fnmatch.fnmatch(name, p) for p in SNAPSHOT_EXCLUDE):
+                    continue
+                con.execute(f"CREATE SCHEMA IF NOT EXISTS memory.{_quote_ident(schema)}")
+                con.execute(
+                    f"CREATE TABLE memory.{_quote_ident(schema)}.{_quote_ident(name)} AS "
+                    f"SELECT * FROM disk.{_quote_ident(schema)}.{_quote_ident(name)}"
+                )
+                tables.append(f"{schema}.{name}")
+        finally:
+            # the file is free again for the pipeline
+            con.execute("DETACH disk")
+        con.execute("USE memory.main")
+        # clients only read the snapshot: no files, extensions or settings changes
+        con.execute("SET enable_external_access = false")
+        con.execute("SET lock_configuration = true")
+
+        self.con = con
+        self.generation = gen
+        self.tables = tables
+
+    def execute(self, sql: str, params: list | None) -> pa.Table:
+        statements = self.con.extract_statements(sql)
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            raise duckdb.PermissionException("query server accepts a single SELECT statement")
+        # one cursor per request -> concurrent requests don't share state
+        with self.con.cursor() as cur:
+            return cur.execute(sql, params).fetch_arrow_table()
+
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        if self.path.exists():
+            self.path.unlink()
+        self._cond = threading.Condition()
+        self._writer: object | None = None  # connection holding the write lease
+        self._reloading = False
+        self.snapshot = Snapshot()
+        super().__init__(str(self.path), _Handler)
+        print(f"✅ query server: {len(self.snapshot.tables)} tables in memory, socket {self.path}")
+
+    # -- snapshot / lease --
+
+    def reload(self) -> str:
+        """Load a new snapshot (not while a write lease is held) and swap it in."""
+        with self._cond:
+            while self._writer is not None or self._reloading:
+                self._cond.wait()
+            self._reloading = True
+        try:
+            snapshot = Snapshot()
+            self.snapshot = snapshot  # in-flight queries finish on the old one
+            return snapshot.generation
+        finally:
+            with self._cond:
+                self._reloading = False
+                self._cond.notify_all()
+
+    def begin_write(self, owner) -> None:
+        with self._cond:
+            while self._writer is not None or self._reloading:
+                self._cond.wait()
+            self._writer = owner
+
+    def end_write(self, owner) -> str:
+        with self._cond:
+            if self._writer is not owner:
+                raise RuntimeError("write lease not held by this client")
+            self._writer = None
+            self._cond.notify_all()
+        return self.reload()
+
+    def watch(self) -> None:
+        """Pick up writes made without a lease (checked every POLL_S)."""
+        while True:
+            time.sleep(POLL_S)
+            with self._cond:
+                busy = self._writer is not None or self._reloading
+            if not busy and file_generation() != self.snapshot.generation:
+                try:
+                    self.reload()
+                except duckdb.Error as e:
+                    # someone is still writing the file -> next round
+                    print(f"⚠️ snapshot reload postponed: {e}")
+
+    def server_close(self) -> None:
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            self.path.unlink()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: QueryServer
+
+    def handle(self) -> None:
+        sock = self.request
+        owner = object()
+        try:
+            while True:
+                try:
+                    req = _recv_json(sock)
+                except ConnectionError:
+                    return
+                self._dispatch(sock, req, owner)
+        finally:
+            # client went away while holding the lease -> release it
+            with contextlib.suppress(RuntimeError):
+                if self.server._writer is owner:
+                    self.server.end_write(owner)
+
+    def _dispatch(self, sock: socket.socket, req: dict, owner) -> None:
+        op = req.get("op")
+        try:
+            if op == "query":
+                table = self.server.snapshot.execute(req["sql"], req.get("params"))
+                _send_json(sock, {"ok": True})
+                _send_frame(sock, _to_ipc(table))
+            elif op == "generation":
+                _send_json(sock, {"ok": True, "generation": self.server.snapshot.generation})
+            elif op == "begin_write":
+                self.server.begin_write(owner)
+                _send_json(sock, {"ok": True})
+            elif op == "end_write":
+                gen = self.server.end_write(owner)
+                _send_json(sock, {"ok": True, "generation": gen})
+            else:
+                _send_json(sock, {"ok": False, "type": "Error", "error": f"unknown op: {op}"})
+        except Exception as e:
+            # anything else would end the connection without a reply
+            _send_json(sock, {"ok": False, "type": type(e).__name__, "error": str(e)})
+
+
+# ---------------- client ----------------
+
+class QueryClient:
+    """One socket per thread to the query server (reconnects after errors)."""
+
+    def __init__(self, path: str | Path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _sock(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _drop(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _call(self, req: dict) -> tuple[dict, socket.socket]:
+        try:
+            sock = self._sock()
+            _send_json(sock, req)
+            reply = _recv_json(sock)
+        except OSError:
+            self._drop()
+            raise
+        if not reply.get("ok"):
+            # same exception types as a local connection (CatalogException, ...)
+            exc = getattr(duckdb, reply.get("type", ""), None)
+            if not (isinstance(exc, type) and issubclass(exc, duckdb.Error)):
+                exc = duckdb.Error
+            raise exc(reply.get("error", "query server error"))
+        return reply, sock
+
+    def query_arrow(self, sql: str, params: list | None = None) -> pa.Table:
+        _reply, sock = self._call({"op": "query", "sql": sql, "params": list(params) if params else None})
+        try:
+            return pa.ipc.open_stream(_recv_frame(sock)).read_all()
+        except OSError:
+            self._drop()
+            raise
+
+    def generation(self) -> str:
+        return self._call({"op": "generation"})[0]["generation"]
+
+    def begin_write(self) -> None:
+        self._call({"op": "begin_write"})
+
+    def end_write(self) -> str:
+        return self._call({"op": "end_write"})[0]["generation"]
+
+
+_CLIENTS: dict[str, QueryClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def client(path: str | Path | None = None) -> QueryClient:
+    """Shared client for `path` (default QUERY_SERVER_SOCKET)."""
+    key = str(path or QUERY_SERVER_SOCKET or DEFAULT_SOCKET)
+    with _CLIENTS_LOCK:
+        c = _CLIENTS.get(key)
+        if c is None:
+            c = _CLIENTS[key] = QueryClient(key)
+        return c
+
+
+class _Result:
+    def __init__(self, table: pa.Table):
+        self._table = table
+
+    def df(self) -> pd.DataFrame:
+        # same dtypes as DuckDB's fetchdf(): DECIMAL -> float64, DATE -> datetime64
+        table = self._table
+        for i, field in enumerate(table.schema):
+            if pa.types.is_decimal(field.type):
+                table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+        return table.to_pandas(date_as_object=False)
+
+    fetchdf = df
+
+    def fetch_arrow_table(self) -> pa.Table:
+        return self._table
+
+    def fetch_record_batch(self, rows_per_batch: int = 1_000_000) -> pa.RecordBatchReader:
+        return self._table.to_reader(rows_per_batch)
+
+    def fetchall(self) -> list[tuple]:
+        return list(zip(*(col.to_pylist() for col in self._table.columns)))
+
+
+class ClientConnection:
+    """
+    The part of DuckDBPyConnection the readers use (execute -> df/fetchall/...),
+    answered by the query server. Works as a context manager like a connection.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self._client = client(path)
+
+    def execute(self, sql: str, params: list | None = None) -> _Result:
+        return _Result(self._client.query_arrow(sql, params))
+
+    def generation(self) -> str:
+        return self._client.generation()
+
+    def cursor(self) -> "ClientConnection":
+        return self
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "ClientConnection":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def connect(path: str | Path | None = None) -> ClientConnection:
+    return ClientConnection(path)
+
+
+@contextlib.contextmanager
+def write_lease(path: str | Path | None = None):
+    """
+    Hold the server's write lease while the block writes the database file.
+    Without QUERY_SERVER_SOCKET (no server) this does nothing.
+    """
+    if not (path or QUERY_SERVER_SOCKET):
+        yield
+        return
+    c = client(path)
+    c.begin_write()
+    try:
+        yield
+    finally:
+        gen = c.end_write()
+        print(f"✅ query server reloaded snapshot {gen}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Own the DuckDB file and answer queries over a Unix socket.")
+    parser.add_argument("--socket", default=QUERY_SERVER_SOCKET or str(DEFAULT_SOCKET))
+    args = parser.parse_args()
+
+    server = QueryServer(Path(args.socket))
+    threading.Thread(target=server.watch, name="snapshot-watch", daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,139 @@
+import os
+import threading
+from collections import OrderedDict
+
 import pandas as pd
 import plotly.express as px
-from backend.data_processing import trend_df, choice_df, fair_df
+from taipy.gui import get_state_id, invoke_callback
+from backend.data_processing import get_mart_index, TREND_TABLE, CHOICE_TABLE, FAIR_TABLE
+from backend.filter_index import MartIndex
 from backend.data_processing import build_behorighet_gender_figure
 from backend.data_processing import (
     build_karta_budget_figure,   # (fig_map, df_budget) برای یک سال
     build_top_bottom_budget,     # (fig_top, fig_bot) از df_budget
     query_df,)   # ✅ از backend.db میاد داخل data_processing و اینجا قابل استفاده است
+from backend import queries
+from backend.queries import PUSHDOWN_ENABLED
+from backend.figure_cache import figure_cache, normalize_filters
+from backend.figure_transport import compact_numeric_arrays
+from backend.db import data_generation
+from backend.utils import is_all
 
 
+def _apply_common_filters(df: pd.DataFrame | MartIndex, year, lan, kommun, huvudman, subject):
+    """
+    Common filter helper (used by Trend/Fairness).
+    With a MartIndex the filters are resolved from its row-position arrays
+    instead of scanning every column.
+    """
+    if isinstance(df, MartIndex):
+        return df.select(
+            year=year,
+            lan=lan,
+            kommun=kommun,
+            huvudman_typ=huvudman,
+            subject=subject,
+        )
 
-def _is_all(x) -> bool:
-    """Treat All/ALL/None/empty as All."""
-    if x is None:
-        return True
-    s = str(x).strip()
-    return s == "" or s.lower() == "all"
-
-
-def _apply_common_filters(df: pd.DataFrame, year, lan, kommun, huvudman, subject):
-    """Common filter helper (used by Trend/Fairness)."""
-    if not _is_all(year):
+    if not is_all(year):
         df = df[df["year"] == year]
-    if not _is_all(lan):
+    if not is_all(lan):
         df = df[df["lan"] == lan]
-    if kommun is not None and not _is_all(kommun):
+    if kommun is not None and not is_all(kommun):
         df = df[df["kommun"] == kommun]
-    if not _is_all(huvudman):
+    if not is_all(huvudman):
         df = df[df["huvudman_typ"] == huvudman]
-    if not _is_all(subject):
+    if not is_all(subject):
         df = df[df["subject"] == subject]
     return df
 
 
+# ---------------- Refresh scheduler ----------------
+
+# REFRESH_DEBOUNCE_MS: window in which change events of one session are merged
+REFRESH_DEBOUNCE_S = float(os.getenv("REFRESH_DEBOUNCE_MS", "150")) / 1000.0
+
+
+class RefreshScheduler:
+    """
+    Per-session debounce + dedup for the refresh callbacks.
+
+    Every on_change/on_click schedules a refresh for (session, view). Events
+    arriving within the debounce window replace the pending one, so a burst
+    (e.g. Län change -> Kommun reset) runs a single refresh. When the timer
+    fires the filter key is compared with the last one that session rendered;
+    identical filter states (same data generation) are skipped.
+    """
+
+    MAX_SESSIONS_TRACKED = 10_000
+
+    def __init__(self, delay: float):
+        self.delay = float(delay)
+        self._timers: dict[tuple, threading.Timer] = {}
+        self._last_keys: OrderedDict[tuple, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(self, state, view: str, key_fn, refresh) -> None:
+        state_id = get_state_id(state)
+        if state_id is None or self.delay <= 0:
+            # not inside a Taipy session (tests, load tests) -> run now
+            self._run(state, (id(state), view), key_fn, refresh)
+            return
+
+        gui = state.get_gui()
+        slot = (state_id, view)
+        timer = threading.Timer(self.delay, self._fire, args=(gui, state_id, slot, key_fn, refresh))
+        timer.daemon = True
+
+        with self._lock:
+            pending = self._timers.pop(slot, None)
+            if pending is not None:
+                pending.cancel()
+            self._timers[slot] = timer
+        timer.start()
+
+    def _fire(self, gui, state_id, slot, key_fn, refresh) -> None:
+        with self._lock:
+            if self._timers.get(slot) is not threading.current_thread():
+                return  # superseded by a newer event
+            del self._timers[slot]
+        invoke_callback(gui, state_id, self._run, [slot, key_fn, refresh])
+
+    def _run(self, state, slot, key_fn, refresh) -> None:
+        key = (key_fn(state), data_generation())
+        with self._lock:
+            if self._last_keys.get(slot) == key:
+                return
+        refresh(state)
+
+    def mark(self, state, view: str, key_fn) -> None:
+        """Record that `view` is now rendered for the session's current filters."""
+        slot = (get_state_id(state) or id(state), view)
+        with self._lock:
+            self._last_keys[slot] = (key_fn(state), data_generation())
+            self._last_keys.move_to_end(slot)
+            while len(self._last_keys) > self.MAX_SESSIONS_TRACKED:
+                self._last_keys.popitem(last=False)
+
+
+scheduler = RefreshScheduler(REFRESH_DEBOUNCE_S)
+
+
 # ---------------- TREND ----------------
 
-def refresh_trend(state):
-    df = trend_df.copy()
+def _trend_plot_frame(lan, kommun, huvudman, subject, color: str) -> pd.DataFrame:
+    """pandas version of queries.trend_series() (used when pushdown is off)."""
+    metric = "score"
 
     # Trend باید چندساله باشد → year را فیلتر نمی‌کنیم
     df = _apply_common_filters(
-        df,
+        get_mart_index(TREND_TABLE),
         year="All",
-        lan=state.trend_lan,
-        kommun=state.trend_kommun,
-        huvudman=(    "All"
-        if not _is_all(state.trend_subject)
-        else state.trend_huvudman
-),
-        subject=state.trend_subject,
-    )
-
-    metric = "score"
+        lan=lan,
+        kommun=kommun,
+        huvudman=huvudman,
+        subject=subject,
+    ).copy()
 
     if metric in df.columns:
         df = df.dropna(subset=[metric])
@@ -64,25 +147,49 @@ def refresh_trend(state):
             df = df[df["year"] < last_year]
 
     if df.empty or metric not in df.columns:
-        fig = px.line(pd.DataFrame({"year": [], "value": []}), x="year", y="value")
-        fig.update_layout(title="No data for this selection")
-        state.trend_fig = fig
-        return
-
-    # Color logic: if subject is All -> split by subject, else split by huvudman
-    color = "subject" if _is_all(state.trend_subject) else "huvudman_typ"
+        return pd.DataFrame({"year": [], color: [], metric: []})
 
     group_cols = ["year"]
     if color in df.columns:
         group_cols.append(color)
 
-    df_plot = (
-        df.groupby(group_cols, as_index=False)[metric]
+    return (
+        df.groupby(group_cols, as_index=False, observed=True)[metric]
           .mean()
           .sort_values("year")
     )
 
 
+def build_trend_figure(lan, kommun, huvudman, subject):
+    """Trend line chart for one filter state (no Taipy state involved)."""
+    metric = "score"
+
+    # Color logic: if subject is All -> split by subject, else split by huvudman
+    color = "subject" if is_all(subject) else "huvudman_typ"
+    huvudman = "All" if not is_all(subject) else huvudman
+
+    if PUSHDOWN_ENABLED:
+        df_plot = queries.trend_series(
+            lan=lan,
+            kommun=kommun,
+            huvudman=huvudman,
+            subject=subject,
+            color=color,
+        )
+    else:
+        df_plot = _trend_plot_frame(
+            lan=lan,
+            kommun=kommun,
+            huvudman=huvudman,
+            subject=subject,
+            color=color,
+        )
+
+    if df_plot.empty:
+        fig = px.line(pd.DataFrame({"year": [], "value": []}), x="year", y="value")
+        fig.update_layout(title="No data for this selection")
+        return fig
+
     fig = px.line(
         df_plot,
         x="year",
@@ -139,7 +246,7 @@ def refresh_trend(state):
     fig.update_traces(line=dict(width=3), marker=dict(size=7))
     last_year = df_plot["year"].max()
 
-    for key, g in df_plot.groupby(color):
+    for key, g in df_plot.groupby(color, observed=True):
         last_row = g[g["year"] == last_year]
         if last_row.empty:
             continue
@@ -156,74 +263,104 @@ def refresh_trend(state):
         )
 
 
+    return compact_numeric_arrays(fig)
+
+
+def _trend_key(state) -> tuple:
+    return normalize_filters(state.trend_lan, state.trend_kommun, state.trend_huvudman, state.trend_subject)
 
-    state.trend_fig = fig
+
+def refresh_trend(state):
+    state.trend_fig = figure_cache.get_or_build(
+        "trend",
+        _trend_key(state),
+        lambda: build_trend_figure(
+            lan=state.trend_lan,
+            kommun=state.trend_kommun,
+            huvudman=state.trend_huvudman,
+            subject=state.trend_subject,
+        ),
+    )
+    scheduler.mark(state, "trend", _trend_key)
 
 
 def on_change_trend(state):
     update_trend_kommun_lov(state)
-    refresh_trend(state)
+    scheduler.schedule(state, "trend", _trend_key, refresh_trend)
 
 
 def on_click_trend(state):
-    refresh_trend(state)
+    scheduler.schedule(state, "trend", _trend_key, refresh_trend)
 
 
 def update_trend_kommun_lov(state):
-    if _is_all(state.trend_lan):
-        state.trend_kommun_lov = ["All"] + sorted(trend_df["kommun"].dropna().unique().tolist())
-        if state.trend_kommun not in state.trend_kommun_lov:
-            state.trend_kommun = "All"
-        return
-
-    df_lan = trend_df[trend_df["lan"] == state.trend_lan]
-    kommuner = ["All"] + sorted(df_lan["kommun"].dropna().unique().tolist())
-    state.trend_kommun_lov = kommuner
-
-    if state.trend_kommun not in state.trend_kommun_lov:
+    if PUSHDOWN_ENABLED:
+        # SELECT DISTINCT in DuckDB: the trend mart isn't loaded for a dropdown
+        kommuner = ["All"] + queries.distinct_values(TREND_TABLE, "kommun", {"lan": state.trend_lan})
+    else:
+        index = get_mart_index(TREND_TABLE)
+        if is_all(state.trend_lan):
+            kommuner = ["All"] + sorted(index.values("kommun"))
+        else:
+            df_lan = index.select(lan=state.trend_lan)
+            kommuner = ["All"] + sorted(df_lan["kommun"].dropna().unique().tolist())
+
+    # only push the LOV / reset kommun when something actually changes
+    if list(state.trend_kommun_lov) != kommuner:
+        state.trend_kommun_lov = kommuner
+
+    if state.trend_kommun not in kommuner:
         state.trend_kommun = "All"
 
 
 # ---------------- FAIRNESS ----------------
 
-def refresh_fairness(state):
-    df = fair_df.copy()
+def _fairness_top_gap(year, lan, huvudman, subject, top_n: int) -> pd.DataFrame:
+    """pandas version of queries.fairness_top_gap() (used when pushdown is off)."""
+    df = _apply_common_filters(
+        get_mart_index(FAIR_TABLE),
+        year=year,
+        lan=lan,
+        kommun=None,
+        huvudman=huvudman,
+        subject=subject,
+    )
+
+    # --- aggregate to kommun level ---
+    df_g = (
+        df.groupby("kommun", as_index=False, observed=True)[["betygpoang_flickor", "betygpoang_pojkar"]]
+          .mean()
+    )
 
+    df_g["gap_abs"] = (df_g["betygpoang_flickor"] - df_g["betygpoang_pojkar"]).abs()
+    return df_g.sort_values("gap_abs", ascending=False).head(top_n)
+
+
+def build_fairness_figure(year, lan, huvudman, subject):
+    """Girls/boys gap chart + table for one filter state -> (fig, table)."""
     # --- year type fix (Taipy may give str) ---
-    fair_year = state.fair_year
-    if not _is_all(fair_year):
+    fair_year = year
+    if not is_all(fair_year):
         try:
             fair_year = int(fair_year)
         except Exception:
             fair_year = "All"
 
-    # --- filters ---
-    df = _apply_common_filters(
-        df,
+    # --- Top 10 by absolute gender gap ---
+    TOP_N = 10
+    top_gap = queries.fairness_top_gap if PUSHDOWN_ENABLED else _fairness_top_gap
+    df_g = top_gap(
         year=fair_year,
-        lan=state.fair_lan,
-        kommun=None,
-        huvudman=state.fair_huvudman,
-        subject=state.fair_subject,
+        lan=lan,
+        huvudman=huvudman,
+        subject=subject,
+        top_n=TOP_N,
     )
 
-    if df.empty:
-        state.fair_table = df.head(50)
+    if df_g.empty:
         fig = px.bar(pd.DataFrame({"kommun": [], "value": []}), x="value", y="kommun", orientation="h")
         fig.update_layout(title="No data for this selection")
-        state.fair_fig = fig
-        return
-
-    # --- aggregate to kommun level ---
-    df_g = (
-        df.groupby("kommun", as_index=False)[["betygpoang_flickor", "betygpoang_pojkar"]]
-          .mean()
-    )
-
-    # --- Top 15 by absolute gender gap ---
-    TOP_N = 10
-    df_g["gap_abs"] = (df_g["betygpoang_flickor"] - df_g["betygpoang_pojkar"]).abs()
-    df_g = df_g.sort_values("gap_abs", ascending=False).head(TOP_N)
+        return fig, df_g
 
     # --- reshape to long format for grouped bars (Girls/Boys) ---
     df_long = df_g.melt(
@@ -256,7 +393,7 @@ def refresh_fairness(state):
 
     # --- clean title (no clutter line with filters) ---
     title_text = f"Average Grade Differences Between Girls and Boys {TOP_N} Municipalities"
-    #subtitle = f"{state.fair_subject} • {state.fair_huvudman} • {state.fair_lan} • {state.fair_year}"
+    #subtitle = f"{subject} • {huvudman} • {lan} • {year}"
 
     fig.update_layout(
         title=dict(
@@ -308,95 +445,153 @@ def refresh_fairness(state):
     fig.update_traces(marker_line_width=0)
 
     # --- table (optional but useful) ---
-    state.fair_table = df_g[["kommun", "betygpoang_flickor", "betygpoang_pojkar", "gap_abs"]].copy()
+    table = df_g[["kommun", "betygpoang_flickor", "betygpoang_pojkar", "gap_abs"]].copy()
+
+    return compact_numeric_arrays(fig), table
 
-    state.fair_fig = fig
+
+def _fairness_key(state) -> tuple:
+    return normalize_filters(state.fair_year, state.fair_lan, state.fair_huvudman, state.fair_subject)
+
+
+def refresh_fairness(state):
+    state.fair_fig, state.fair_table = figure_cache.get_or_build(
+        "fairness",
+        _fairness_key(state),
+        lambda: build_fairness_figure(
+            year=state.fair_year,
+            lan=state.fair_lan,
+            huvudman=state.fair_huvudman,
+            subject=state.fair_subject,
+        ),
+    )
+    scheduler.mark(state, "fairness", _fairness_key)
 
 
 
 def on_change_fairness(state):
-    refresh_fairness(state)
+    scheduler.schedule(state, "fairness", _fairness_key, refresh_fairness)
 
 def on_click_fairness(state):
-    refresh_fairness(state)
+    scheduler.schedule(state, "fairness", _fairness_key, refresh_fairness)
 
 
 # ---------------- PARENT CHOICE (NO SUBJECT) ----------------
 
-def _is_all(x):
-    if x is None:
-        return True
-    return str(x).strip().lower() == "all"
+def _parent_choice_counts(lan) -> pd.DataFrame:
+    """
+    pandas version of queries.parent_choice_counts() (used when pushdown is off):
+    one groupby -> year, kommun, Enskild, Kommunal, total, share.
+    """
+    df = get_mart_index(CHOICE_TABLE).select(
+        lan=lan,
+        huvudman_typ=["Kommunal", "Enskild"],
+    )
+    df = df[df["n_students"].notna()]
 
+    counts = (
+        df.groupby(["year", "kommun", "huvudman_typ"], observed=True, sort=False)["n_students"]
+          .sum()
+          .unstack("huvudman_typ", fill_value=0)
+          .reindex(columns=["Enskild", "Kommunal"], fill_value=0)
+          .reset_index()
+    )
+    counts.columns.name = None
+
+    total = counts["Enskild"] + counts["Kommunal"]
+    counts["total"] = total
+    counts["share"] = (counts["Enskild"] / total.where(total > 0)).fillna(0.0)
+    return counts
+
+
+def _top_kommun(counts: pd.DataFrame, top_n: int) -> pd.Index:
+    """Top-N kommuner by total students in `counts`."""
+    return (
+        counts.groupby("kommun", observed=True)["total"]
+              .sum()
+              .sort_values(ascending=False, kind="stable")
+              .head(top_n)
+              .index
+    )
 
-def refresh_parent_choice(state):
+
+def _parent_choice_frames(counts: pd.DataFrame, year, top_n: int) -> tuple[pd.DataFrame, pd.DataFrame]:
     """
+    Both parent-choice views from one year x kommun count table:
+      df_k: long rows (year, kommun, huvudman_typ, n_students, share) for the stacked bars
+      p:    Enskild share per (year, kommun) for the trend lines
+    """
+    if counts.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    # Trend: Top N kommun by total students across years (within selected län)
+    trend_top = _top_kommun(counts, top_n)
+    p = counts[counts["kommun"].isin(trend_top)].sort_values(["year", "kommun"])
+
+    # Stack: Top N kommun for the selected year (same ranking when year is All)
+    if is_all(year):
+        c_year, stack_top = counts, trend_top
+    else:
+        c_year = counts[counts["year"] == year]
+        stack_top = _top_kommun(c_year, top_n)
+
+    k = c_year[c_year["kommun"].isin(stack_top)]
+    df_k = k.melt(
+        id_vars=["year", "kommun", "total"],
+        value_vars=["Enskild", "Kommunal"],
+        var_name="huvudman_typ",
+        value_name="n_students",
+    )
+    df_k["share"] = (df_k["n_students"] / df_k["total"].where(df_k["total"] > 0)).fillna(0.0)
+
+    return df_k.drop(columns="total"), p
+
+
+def build_parent_choice_figures(year, lan, top_n):
+    """
+    Stacked share chart + Enskild trend chart for one filter state
+    -> (fig_stack, fig_trend). fig_trend is None when the stack has no data.
+
     Requires choice_df with columns:
       year (int), lan (str), kommun (str), huvudman_typ (Kommunal/Enskild),
       n_students (int), share (float 0..1)
     """
 
-    df = choice_df.copy()
+    try:
+        top_n = int(top_n)
+    except Exception:
+        top_n = 10
 
-    # -------------------------
-    # Filters (single year)
-    # -------------------------
-    if not _is_all(state.parent_choice_year):
+    year_ok = True
+    if not is_all(year):
         try:
-            y = int(state.parent_choice_year)
-            df = df[df["year"] == y]
+            year = int(year)
         except Exception:
-            df = df.iloc[0:0]
+            year_ok = False
 
-    if not _is_all(state.parent_choice_lan):
-        df = df[df["lan"] == state.parent_choice_lan]
+    if not year_ok:
+        counts = pd.DataFrame()
+    elif PUSHDOWN_ENABLED:
+        counts = queries.parent_choice_counts(lan)
+    else:
+        counts = _parent_choice_counts(lan)
 
-    df = df[df["huvudman_typ"].isin(["Kommunal", "Enskild"])].dropna(subset=["n_students"])
+    df_k, p = _parent_choice_frames(counts, year, top_n)
 
-    if df.empty:
-        state.parent_choice_fig_stack = (
+    if df_k.empty:
+        fig_stack = (
             px.bar(pd.DataFrame({"kommun": [], "share": [], "huvudman_typ": []}),
                    x="kommun", y="share", color="huvudman_typ", barmode="stack")
             .update_layout(title="No data for this selection")
         )
        
-        return
-
-    # -------------------------
-    # Top N kommun (by total students)
-    # -------------------------
-    try:
-        top_n = int(state.parent_choice_top_n)
-    except Exception:
-        top_n = 10
-
-    totals = (
-        df.groupby("kommun", as_index=False)["n_students"]
-          .sum()
-          .sort_values("n_students", ascending=False)
-          .head(top_n)
-    )
-    top_kommun = totals["kommun"].tolist()
-    df_k = df[df["kommun"].isin(top_kommun)].copy()
-
-    # -------------------------
-    # Ensure share is valid (recompute if missing/bad)
-    # -------------------------
-    share_bad = ("share" not in df_k.columns) or df_k["share"].isna().any()
-    if share_bad:
-        denom = (
-            df_k.groupby(["kommun"], as_index=False)["n_students"]
-               .sum()
-               .rename(columns={"n_students": "total_students"})
-        )
-        df_k = df_k.merge(denom, on="kommun", how="left")
-        df_k["share"] = df_k["n_students"] / df_k["total_students"]
+        return fig_stack, None
 
     # -------------------------
     # Order kommun by Enskild share (nice reading)
     # -------------------------
     pivot = (
-        df_k.pivot_table(index="kommun", columns="huvudman_typ", values="share", aggfunc="mean")
+        df_k.pivot_table(index="kommun", columns="huvudman_typ", values="share", aggfunc="mean", observed=True)
           .fillna(0.0)
     )
     sort_col = "Enskild" if "Enskild" in pivot.columns else pivot.columns[0]
@@ -469,7 +664,6 @@ def refresh_parent_choice(state):
 
     fig_stack.update_traces(marker_line_width=0)
 
-    state.parent_choice_fig_stack = fig_stack
 
 
 
@@ -478,14 +672,7 @@ def refresh_parent_choice(state):
     # =========================
     # 2) Trend over time — Enskild share per kommun (within selected län)
     # =========================
-    df_t = choice_df.copy()
-
-    if not _is_all(state.parent_choice_lan):
-        df_t = df_t[df_t["lan"] == state.parent_choice_lan]
-
-    df_t = df_t[df_t["huvudman_typ"].isin(["Kommunal", "Enskild"])].dropna(subset=["n_students"])
-
-    if df_t.empty:
+    if p.empty:
         fig_trend = px.line(
             pd.DataFrame({"year": [], "share": [], "kommun": []}),
             x="year",
@@ -493,46 +680,7 @@ def refresh_parent_choice(state):
             color="kommun",
         )
         fig_trend.update_layout(title="No data for trend selection")
-        state.parent_choice_fig_trend = fig_trend
-        return
-
-    # Sum counts per year/kommun/type
-    g = (
-        df_t.groupby(["year", "kommun", "huvudman_typ"], as_index=False)["n_students"]
-            .sum()
-    )
-
-    # Pivot to get Kommunal + Enskild counts
-    p = (
-        g.pivot_table(
-            index=["year", "kommun"],
-            columns="huvudman_typ",
-            values="n_students",
-            aggfunc="sum",
-        )
-        .fillna(0.0)
-        .reset_index()
-    )
-
-    if "Enskild" not in p.columns:
-        p["Enskild"] = 0.0
-    if "Kommunal" not in p.columns:
-        p["Kommunal"] = 0.0
-
-    p["total"] = p["Enskild"] + p["Kommunal"]
-    p["share"] = p.apply(lambda r: (r["Enskild"] / r["total"]) if r["total"] > 0 else 0.0, axis=1)
-
-    # Limit lines: Top N kommun by total students across years (within selected län)
-    top_n = int(state.parent_choice_top_n)
-    kommun_rank = (
-        df_t.groupby("kommun", as_index=False)["n_students"]
-            .sum()
-            .sort_values("n_students", ascending=False)
-            .head(top_n)["kommun"]
-            .tolist()
-    )
-
-    p = p[p["kommun"].isin(kommun_rank)].sort_values(["year", "kommun"])
+        return fig_stack, fig_trend
 
     fig_trend = px.line(
         p,
@@ -586,28 +734,54 @@ def refresh_parent_choice(state):
 )
 
 
-    state.parent_choice_fig_trend = fig_trend
+    return compact_numeric_arrays(fig_stack), compact_numeric_arrays(fig_trend)
+
+
+def _parent_choice_key(state) -> tuple:
+    return normalize_filters(state.parent_choice_year, state.parent_choice_lan, state.parent_choice_top_n)
+
+
+def refresh_parent_choice(state):
+    fig_stack, fig_trend = figure_cache.get_or_build(
+        "parent_choice",
+        _parent_choice_key(state),
+        lambda: build_parent_choice_figures(
+            year=state.parent_choice_year,
+            lan=state.parent_choice_lan,
+            top_n=state.parent_choice_top_n,
+        ),
+    )
+    state.parent_choice_fig_stack = fig_stack
+    if fig_trend is not None:
+        state.parent_choice_fig_trend = fig_trend
+    scheduler.mark(state, "parent_choice", _parent_choice_key)
 
 
 def on_change_parent_choice(state):
-    refresh_parent_choice(state)
+    scheduler.schedule(state, "parent_choice", _parent_choice_key, refresh_parent_choice)
 
 
 def on_click_parent_choice(state):
-    refresh_parent_choice(state)
+    scheduler.schedule(state, "parent_choice", _parent_choice_key, refresh_parent_choice)
 
 
 def refresh_behorighet_gender(state):
-    state.beh_fig = build_behorighet_gender_figure("2024/25")
+    state.beh_fig = figure_cache.get_or_build(
+        "behorighet_gender",
+        ("2024/25",),
+        lambda: build_behorighet_gender_figure("2024/25"),
+    )
 
 
 ## ------------------ karta (BUDGET only) ------------------
-def refresh_karta(state):
+def build_karta_figures(level: str = "Kommun", lan: str = "All"):
     """
     Budget per elev per kommun (senaste tillgängliga år).
     - بدون Ranking
-    - بدون فیلتر
+    - level "Län": 21 län shapes with student-weighted values
+    - lan: drill-down into the kommuner of one län
     - Top 10 / Bottom 10
+    -> (fig_map, fig_top, fig_bot), all None when there is no budget data.
     """
 
     
@@ -616,18 +790,120 @@ def refresh_karta(state):
         from main.mart_budget_per_elev_kommun
     """)
     if dfy.empty or dfy.iloc[0]["y"] is None:
-        state.karta_fig = None
-        state.karta_top_fig = None
-        state.karta_bot_fig = None
-        return
+        return None, None, None
 
     year = int(dfy.iloc[0]["y"])
 
-    fig, df_budget = build_karta_budget_figure(year)
-    state.karta_fig = fig
+    by_lan = level == "Län"
+    fig, df_budget = build_karta_budget_figure(year, level, "All" if by_lan else lan)
+    fig_top, fig_bot = build_top_bottom_budget(df_budget, 10, "lan" if by_lan else "kommun")
+
+    return fig, fig_top, fig_bot
+
+
+def karta_cache_key(level, lan) -> tuple:
+    """Figure-cache key of the budget map (also used by precompute_default_figures)."""
+    # the län filter has no effect on the län map
+    return normalize_filters(level, "All" if level == "Län" else lan)
+
+
+def _karta_key(state) -> tuple:
+    return karta_cache_key(state.karta_level, state.karta_lan)
+
+
+def refresh_karta(state):
+    key = _karta_key(state)
+    state.karta_fig, state.karta_top_fig, state.karta_bot_fig = figure_cache.get_or_build(
+        "karta",
+        key,
+        lambda: build_karta_figures(*key),
+    )
+    scheduler.mark(state, "karta", _karta_key)
 
-    state.karta_top_fig, state.karta_bot_fig = build_top_bottom_budget(df_budget, 10)
+
+def on_change_karta(state):
+    scheduler.schedule(state, "karta", _karta_key, refresh_karta)
 
 
 def on_click_karta(state):
-    refresh_karta(state)
\ No newline at end of file
+    refresh_karta(state)
+
+## ------------------ Page activation ------------------
+class PageActivator:
+    """
+    Runs a page's refresh functions the first time a session navigates to it,
+    instead of computing every page in on_init.
+    """
+
+    MAX_SESSIONS_TRACKED = 10_000
+
+    def __init__(self, initializers: dict[str, tuple]):
+        self.initializers = initializers
+        self._done: OrderedDict[object, set[str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def activate(self, state, page_name: str) -> None:
+        inits = self.initializers.get(page_name)
+        if not inits:
+            return
+
+        # outside a Taipy callback (tests, load tests) there is no state id
+        state_id = get_state_id(state) or id(state)
+        with self._lock:
+            done = self._done.setdefault(state_id, set())
+            self._done.move_to_end(state_id)
+            while len(self._done) > self.MAX_SESSIONS_TRACKED:
+                self._done.popitem(last=False)
+            if page_name in done:
+                return
+            # claimed now so a second navigation doesn't run the inits twice
+            done.add(page_name)
+
+        try:
+            for fn in inits:
+                fn(state)
+        except Exception:
+            # not initialized -> the next visit tries again
+            with self._lock:
+                self._done.get(state_id, set()).discard(page_name)
+            raise
+
+
+# Default filter state of a new session (same values as backend/data_processing.py)
+DEFAULT_TREND_FILTERS = ("All", "All", "All", "All")          # lan, kommun, huvudman, subject
+DEFAULT_FAIRNESS_FILTERS = ("All", "All", "All", "All")       # year, lan, huvudman, subject
+DEFAULT_PARENT_CHOICE_FILTERS = ("All", "All", 10)            # year, lan, top_n
+DEFAULT_KARTA_FILTERS = ("Kommun", "All")                    # level, lan
+
+
+def precompute_default_figures() -> None:
+    """
+    Build the default-state figures of every page into the shared figure cache,
+    so a session's first visit to a page is served from that snapshot.
+    """
+    figure_cache.get_or_build(
+        "trend",
+        normalize_filters(*DEFAULT_TREND_FILTERS),
+        lambda: build_trend_figure(*DEFAULT_TREND_FILTERS),
+    )
+    figure_cache.get_or_build(
+        "fairness",
+        normalize_filters(*DEFAULT_FAIRNESS_FILTERS),
+        lambda: build_fairness_figure(*DEFAULT_FAIRNESS_FILTERS),
+    )
+    figure_cache.get_or_build(
+        "parent_choice",
+        normalize_filters(*DEFAULT_PARENT_CHOICE_FILTERS),
+        lambda: build_parent_choice_figures(*DEFAULT_PARENT_CHOICE_FILTERS),
+    )
+    figure_cache.get_or_build(
+        "behorighet_gender",
+        ("2024/25",),
+        lambda: build_behorighet_gender_figure("2024/25"),
+    )
+    # same key as refresh_karta() looks up for a new session
+    figure_cache.get_or_build(
+        "karta",
+        karta_cache_key(*DEFAULT_KARTA_FILTERS),
+        lambda: build_karta_figures(*DEFAULT_KARTA_FILTERS),
+    )
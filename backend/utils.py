@@ -21,3 +21,10 @@ def safe_filter(df: pd.DataFrame, col: str | None, value):
     if col and col in df.columns and value not in (None, "All"):
         return df[df[col] == value]
     return df
+
+def is_all(value) -> bool:
+    """Treat All/ALL/None/empty as "no filter"."""
+    if value is None:
+        return True
+    s = str(value).strip()
+    return s == "" or s.lower() == "all"
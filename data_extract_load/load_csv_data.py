@@ -7,6 +7,7 @@ import dlt
 import duckdb
 
 from config import BASE_DIR, RAW_DATA_DIR, DB_FILE, DBT_DIR, as_posix
+from backend.query_server import write_lease
 BASE_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(BASE_DIR))
 
@@ -102,6 +103,37 @@ def run_dbt() -> None:
     )
 
 
+def prerender_views() -> None:
+    """
+    Pre-render the dashboard figures for the freshly built marts
+    (backend/prerender.py). Workers load them into their figure cache at
+    startup. A failure here never fails the pipeline: the dashboard then just
+    builds the figures on first use.
+    """
+    try:
+        from backend.prerender import prerender
+
+        prerender()
+    except Exception as e:
+        print(f"⚠️ prerender skipped: {e}")
+
+
+def export_mart_store() -> None:
+    """
+    Re-export the Arrow mart store (backend/mart_store.py) when one is in use,
+    so its workers map the new marts instead of falling back to DuckDB.
+    Like prerender_views(), a failure never fails the pipeline.
+    """
+    from backend.mart_store import current_dir, export_store
+
+    if current_dir() is None:
+        return  # no store exported here (MART_STORE_DIR / ./mart_store)
+    try:
+        export_store()
+    except Exception as e:
+        print(f"⚠️ mart store export skipped: {e}")
+
+
 def run_pipeline() -> None:
     pipeline = dlt.pipeline(
         pipeline_name="csv_ingestion_pipeline",
@@ -110,16 +142,25 @@ def run_pipeline() -> None:
         dev_mode=False,
     )
 
-    load_info = pipeline.run(skolverket_raw_csv())
-    print(load_info)
+    # With a query server (backend/query_server.py) readers keep getting the
+    # previous snapshot while we write; releasing the lease loads the new data.
+    with write_lease():
+        load_info = pipeline.run(skolverket_raw_csv())
+        print(load_info)
+
+        # Sync raw_data: keep only the latest load
+        keep_only_latest_load()
+        print("✅ raw_data synced: kept only latest load")
+
+        # Build stg/silver/marts + run tests
+        run_dbt()
+        print("✅ dbt run + test complete")
 
-    # Sync raw_data: keep only the latest load
-    keep_only_latest_load()
-    print("✅ raw_data synced: kept only latest load")
+    # Workers of app.serve / app.reports map the store: give them the new marts
+    export_mart_store()
 
-    # Build stg/silver/marts + run tests
-    run_dbt()
-    print("✅ dbt run + test complete")
+    # Render the default + most used dashboard views for the new data
+    prerender_views()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+{{ config(materialized='table') }}
+
+-- Budget per elev per län: student-weighted (genomsnittligt_elevantal) averages
+-- of the kommun values, so large kommuner count for more than small ones.
+with kommun as (
+    select
+        lasar_start,
+        lan,
+        lpad(cast(lan_kod as varchar), 2, '0') as lan_kod,
+        huvudman_typ,
+        kommun_kod,
+        genomsnittligt_elevantal,
+        totalt,
+        undervisning,
+        totalt_per_elev,
+        undervisning_per_elev,
+        lokaler_per_elev,
+        maltider_per_elev,
+        larverktyg_per_elev,
+        elevhalsa_per_elev,
+        ovrigt_per_elev
+    from {{ ref('mart_budget_per_elev_kommun') }}
+    where genomsnittligt_elevantal is not null
+      and genomsnittligt_elevantal > 0
+)
+
+select
+    lasar_start,
+    lan,
+    lan_kod,
+    huvudman_typ,
+
+    count(distinct kommun_kod) as n_kommun,
+    sum(genomsnittligt_elevantal) as genomsnittligt_elevantal,
+
+    sum(totalt) as totalt,
+    sum(undervisning) as undervisning,
+
+    sum(totalt_per_elev * genomsnittligt_elevantal) / sum(genomsnittligt_elevantal) as totalt_per_elev,
+    sum(undervisning_per_elev * genomsnittligt_elevantal) / sum(genomsnittligt_elevantal) as undervisning_per_elev,
+    sum(lokaler_per_elev * genomsnittligt_elevantal) / sum(genomsnittligt_elevantal) as lokaler_per_elev,
+    sum(maltider_per_elev * genomsnittligt_elevantal) / sum(genomsnittligt_elevantal) as maltider_per_elev,
+    sum(larverktyg_per_elev * genomsnittligt_elevantal) / sum(genomsnittligt_elevantal) as larverktyg_per_elev,
+    sum(elevhalsa_per_elev * genomsnittligt_elevantal) / sum(genomsnittligt_elevantal) as elevhalsa_per_elev,
+    sum(ovrigt_per_elev * genomsnittligt_elevantal) / sum(genomsnittligt_elevantal) as ovrigt_per_elev
+from kommun
+group by 1, 2, 3, 4
@@ -0,0 +1,41 @@
+{{ config(materialized='table') }}
+
+-- Län ranking (åk 9): kommun averages weighted by their number of rows
+-- (schools/results), ranked within Sweden like mart_ranked_kommun_ak9.
+with lan_agg as (
+    select
+        lasar_start,
+        lan,
+        lpad(cast(lan_kod as varchar), 2, '0') as lan_kod,
+        huvudman_typ,
+        amne,
+        count(*) as n_kommun,
+        sum(n_rows) as n_rows,
+        sum(avg_total * n_rows) / sum(n_rows) as avg_total,
+        sum(avg_gap_f_minus_m * n_rows) filter (where avg_gap_f_minus_m is not null)
+            / nullif(sum(n_rows) filter (where avg_gap_f_minus_m is not null), 0) as avg_gap_f_minus_m
+    from {{ ref('mart_ranked_kommun_ak9') }}
+    group by 1, 2, 3, 4, 5
+),
+
+ranked as (
+    select
+        *,
+        dense_rank() over (
+            partition by lasar_start, huvudman_typ, amne
+            order by avg_total desc
+        ) as rank_in_sweden,
+        count(*) over (
+            partition by lasar_start, huvudman_typ, amne
+        ) as n_lan_sweden,
+        percent_rank() over (
+            partition by lasar_start, huvudman_typ, amne
+            order by avg_total
+        ) as pct_in_sweden
+    from lan_agg
+)
+
+select
+    *,
+    round(pct_in_sweden * 100, 1) as score_0_100
+from ranked
@@ -1,6 +1,7 @@
 import taipy.gui.builder as tgb
 
-from backend.updates import refresh_karta
+from backend.data_processing import KARTA_LEVELS, karta_lan_list
+from backend.updates import on_change_karta, refresh_karta
 
 
 with tgb.Page() as karta_page:
@@ -11,7 +12,10 @@ with tgb.Page() as karta_page:
             mode="md",
         )
 
-       
+        with tgb.layout(columns="1 1"):
+            tgb.toggle(value="{karta_level}", lov=KARTA_LEVELS, label="Level", on_change=on_change_karta)
+            tgb.selector(value="{karta_lan}", lov=karta_lan_list, dropdown=True, label="Län (kommun drill-down)", on_change=on_change_karta)
+
         with tgb.part(class_name="card"):
             tgb.chart(figure="{karta_fig}", mode="plotly")
 